@@ -0,0 +1,24 @@
+"""Add source_hash to laws
+
+Revision ID: 4c2a7e9d1f05
+Revises: bb999ccf3cf0
+Create Date: 2026-10-17 10:12:41.518362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2a7e9d1f05'
+down_revision = 'bb999ccf3cf0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('laws', sa.Column('source_hash', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('laws', 'source_hash')
@@ -0,0 +1,24 @@
+"""Add content_hash to content_items
+
+Revision ID: 7d3e5a1c9b42
+Revises: 4c2a7e9d1f05
+Create Date: 2026-10-17 14:03:27.104518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3e5a1c9b42'
+down_revision = '4c2a7e9d1f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('content_items', sa.Column('content_hash', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('content_items', 'content_hash')
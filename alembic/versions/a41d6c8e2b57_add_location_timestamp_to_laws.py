@@ -0,0 +1,24 @@
+"""Add location_timestamp to laws
+
+Revision ID: a41d6c8e2b57
+Revises: e5b81f04c6d3
+Create Date: 2026-10-17 17:21:36.902417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d6c8e2b57'
+down_revision = 'e5b81f04c6d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('laws', sa.Column('location_timestamp', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('laws', 'location_timestamp')
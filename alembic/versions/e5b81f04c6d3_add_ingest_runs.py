@@ -0,0 +1,35 @@
+"""Add ingest_runs
+
+Revision ID: e5b81f04c6d3
+Revises: 7d3e5a1c9b42
+Create Date: 2026-10-17 16:48:09.331270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b81f04c6d3'
+down_revision = '7d3e5a1c9b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ingest_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('phase', sa.String(), nullable=False),
+        sa.Column('pending_slugs', postgresql.ARRAY(sa.String()), nullable=False),
+        sa.Column('removed_slugs', postgresql.ARRAY(sa.String()), nullable=False),
+        sa.Column('stats', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('started_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ingest_runs')
@@ -0,0 +1,109 @@
+"""
+Download pipeline benchmark against a local stand-in for gesetze-im-internet.de (tests/mirror.py), so that it
+doesn't depend on (or burden) the real site.
+
+For each location backend, `download_laws` runs twice: a cold run into an empty location, and a warm run after
+a fraction of the laws got a new Last-Modified (half of those with changed content). Reports laws/second, bytes
+transferred and request counts for both. The mirror can simulate latency and bandwidth caps; the S3 backend runs
+against moto's in-process S3 stand-in.
+
+Run with `python -m benchmarks.download` (or `inv bench.download`).
+"""
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+
+from rip_api import gesetze_im_internet
+from rip_api.gesetze_im_internet.download import location_from_string
+from tests.mirror import GiiMirror
+
+BACKENDS = ("local", "s3")
+S3_BUCKET = "download-benchmark"
+
+
+@contextlib.contextmanager
+def _location(backend, store_zip):
+    if backend == "local":
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yield location_from_string(tmp_dir, store_zip=store_zip)
+        return
+
+    # moto is a dev dependency, only needed here.
+    from moto import mock_aws
+    from rip_api.gesetze_im_internet import s3_transfer
+
+    # moto needs some credentials to sign requests with.
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3_transfer.get_client().create_bucket(
+            Bucket=S3_BUCKET, CreateBucketConfiguration={"LocationConstraint": s3_transfer.REGION}
+        )
+        yield location_from_string(f"s3://{S3_BUCKET}/gii", store_zip=store_zip)
+
+
+def _measure(location, mirror, concurrency, requests_per_second):
+    mirror.reset_stats()
+    start = time.perf_counter()
+    stats = gesetze_im_internet.download_laws(location, concurrency, requests_per_second, toc_url=mirror.toc_url)
+    seconds = time.perf_counter() - start
+
+    return {
+        "laws": len(mirror.zips),
+        "seconds": seconds,
+        "laws_per_second": len(mirror.zips) / seconds,
+        "megabytes": mirror.bytes_sent / 1024 / 1024,
+        "requests": len(mirror.requests),
+        "responses_200": mirror.count_requests(status=200),
+        "responses_304": mirror.count_requests(status=304),
+        **stats,
+    }
+
+
+def run(
+    backends=BACKENDS, copies=20, latency=0.05, bandwidth=None, concurrency=8, requests_per_second=None,
+    churn=0.1, store_zip=False
+):
+    results = []
+
+    for backend in backends:
+        with GiiMirror(copies=copies, latency=latency, bandwidth=bandwidth) as mirror, \
+                _location(backend, store_zip) as location:
+            cold = _measure(location, mirror, concurrency, requests_per_second)
+            mirror.churn(churn, changed_fraction=0.5)
+            warm = _measure(location, mirror, concurrency, requests_per_second)
+        results += [{"case": f"{backend} cold", **cold}, {"case": f"{backend} warm", **warm}]
+
+    print()
+    print(f"{results[0]['laws']} laws, latency {latency * 1000:.0f} ms, "
+          f"bandwidth {bandwidth or 'unlimited'} B/s, concurrency {concurrency}, churn {churn:.0%}")
+    for result in results:
+        print(
+            f"{result['case']:12} {result['seconds']:7.2f} s  {result['laws_per_second']:7.1f} laws/s  "
+            f"{result['megabytes']:7.1f} MB  {result['requests']:5} requests "
+            f"({result['responses_200']} 200, {result['responses_304']} 304)  "
+            f"{result['downloaded']} downloaded, {result['identical']} identical, "
+            f"{result['not_modified']} not modified"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated location backends")
+    parser.add_argument("--copies", type=int, default=20, help="Serve each fixture law under this many slugs")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds to delay each response by")
+    parser.add_argument("--bandwidth", type=int, help="Bytes/second to send each response body at")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of parallel requests")
+    parser.add_argument("--requests-per-second", type=int, help="Rate limit per host (default: none)")
+    parser.add_argument("--churn", type=float, default=0.1, help="Fraction of laws to bump before the warm run")
+    parser.add_argument("--store-zip", action="store_true", help="Store laws as zip archives")
+    args = parser.parse_args()
+
+    run(
+        args.backends.split(","), args.copies, args.latency, args.bandwidth, args.concurrency,
+        args.requests_per_second, args.churn, args.store_zip
+    )
@@ -0,0 +1,103 @@
+"""
+Ingest benchmark: stores copies of the fixture laws in tests/fixtures/gii_xml into an empty DB, first from a
+single process, then sharded across more and more processes, and reports laws/second for each. The copies get
+unique doknrs, so that each one is a law of its own.
+
+WARNING: Works on the DB configured by DB_URI and deletes all laws in it. Point it at a scratch database.
+
+Run with `python -m benchmarks.ingest` (or `inv bench.ingest`).
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from rip_api import db, gesetze_im_internet, models
+from rip_api.gesetze_im_internet.download import LocalPathLocation
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "gii_xml")
+
+DEFAULT_SHARDS = (1, 2, 4, 8)
+
+
+def _copy_fixtures(dir_path, copies):
+    for slug in sorted(os.listdir(FIXTURES_DIR)):
+        for i in range(copies):
+            copy_dir = os.path.join(dir_path, f"{slug}_{i + 1}")
+            os.makedirs(copy_dir)
+            with open(os.path.join(copy_dir, ".timestamp"), "w") as f:
+                f.write("20201014")
+
+            for name in os.listdir(os.path.join(FIXTURES_DIR, slug)):
+                source_path = os.path.join(FIXTURES_DIR, slug, name)
+                if not name.endswith(".xml"):
+                    shutil.copy(source_path, copy_dir)
+                    continue
+                with open(source_path, "rb") as f:
+                    xml = f.read()
+                with open(os.path.join(copy_dir, name), "wb") as f:
+                    f.write(xml.replace(b'doknr="', f'doknr="C{i + 1}-'.encode("utf-8")))
+
+
+def _measure(location, shards, use_copy, batch_size, drop_search_indexes):
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+
+    start = time.perf_counter()
+    with db.session_scope() as session:
+        stats = gesetze_im_internet.ingest_data_from_location(
+            session, location, use_copy=use_copy, batch_size=batch_size, shards=shards,
+            drop_search_indexes=drop_search_indexes
+        )
+    seconds = time.perf_counter() - start
+
+    return {"shards": shards, "seconds": seconds, "laws_per_second": stats["stored"] / seconds, **stats}
+
+
+def run(shards=DEFAULT_SHARDS, copies=20, use_copy=False, batch_size=50, drop_search_indexes=False):
+    db.init_db()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _copy_fixtures(tmp_dir, copies)
+        location = LocalPathLocation(tmp_dir)
+        for n in shards:
+            results.append(_measure(location, n, use_copy, batch_size, drop_search_indexes))
+
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+
+    print()
+    print(
+        f"{results[0]['stored']} laws, {'COPY' if use_copy else 'diff'} loader, {batch_size} laws per commit, "
+        f"search indexes {'dropped and rebuilt' if drop_search_indexes else 'maintained'}"
+    )
+    for result in results:
+        print(
+            f"{result['shards']:2} shards  {result['seconds']:7.2f} s  {result['laws_per_second']:7.1f} laws/s  "
+            f"{result['laws_per_second'] / results[0]['laws_per_second']:5.2f}x  "
+            f"peak RSS {result['peak_rss_mb']:5.0f} MB"
+            + (f"  index rebuild {result['index_rebuild_seconds']:6.2f} s" if drop_search_indexes else "")
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--shards", default=",".join(map(str, DEFAULT_SHARDS)), help="Comma-separated numbers of shards to run with"
+    )
+    parser.add_argument("--copies", type=int, default=20, help="Number of copies of each fixture law")
+    parser.add_argument("--use-copy", action="store_true", help="Write laws with PostgreSQL COPY")
+    parser.add_argument("--batch-size", type=int, default=50, help="Number of laws to commit per transaction")
+    parser.add_argument(
+        "--drop-search-indexes", action="store_true", help="Drop the search indexes while loading, rebuild them after"
+    )
+    args = parser.parse_args()
+
+    run(
+        [int(n) for n in args.shards.split(",")], args.copies, args.use_copy, args.batch_size,
+        args.drop_search_indexes
+    )
@@ -0,0 +1,193 @@
+"""
+Parser benchmarks on the XML fixtures in tests/fixtures/gii_xml.
+
+`run` is a quick microbenchmark of norms/second for extract_law_attrs + extract_contents.
+
+`run_suite` runs parse_law end-to-end, in-memory and streaming, on each fixture law and on synthetically enlarged
+copies of it (body norms repeated `scale` times). Each case runs in a fresh process so that its peak RSS can be
+measured. Results are written to a JSON file, and can be compared against an earlier results file to flag
+regressions.
+
+Run with `python -m benchmarks.parsing [--suite]` (or `inv bench.parser` / `inv bench.parser-suite`).
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from lxml import etree
+
+from rip_api.gesetze_im_internet.download import LocalPathLocation
+from rip_api.gesetze_im_internet.parsing import extract_contents, extract_law_attrs, load_norms_from_file, parse_law
+from rip_api.gesetze_im_internet.utils import rss_mb
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "gii_xml")
+
+DEFAULT_SCALES = (1, 10, 100)
+# Relative change beyond which a result counts as a regression.
+DEFAULT_THRESHOLD = 0.1
+
+
+def _time_extraction(norms, repeat):
+    header_norm, *body_norms = norms
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract_law_attrs(header_norm)
+        extract_contents(body_norms)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(repeat=5):
+    location = LocalPathLocation(FIXTURES_DIR)
+    total_norms = 0
+    total_seconds = 0.0
+
+    for slug in sorted(os.listdir(FIXTURES_DIR)):
+        norms = load_norms_from_file(location.xml_file_for(slug))
+        seconds = _time_extraction(norms, repeat)
+        total_norms += len(norms)
+        total_seconds += seconds
+        print(f"{slug:10} {len(norms):6} norms  {seconds * 1000:8.1f} ms  {len(norms) / seconds:10.0f} norms/s")
+
+    print(
+        f"{'total':10} {total_norms:6} norms  {total_seconds * 1000:8.1f} ms  "
+        f"{total_norms / total_seconds:10.0f} norms/s"
+    )
+
+
+def enlarge_law_xml(xml_path, scale, out_path):
+    """Write a copy of the law XML with its body norms repeated `scale` times."""
+    tree = etree.parse(xml_path)
+    root = tree.getroot()
+    body_norms = root.findall("norm")[1:]
+
+    for i in range(1, scale):
+        for norm in body_norms:
+            norm_copy = copy.deepcopy(norm)
+            norm_copy.set("doknr", f"{norm.get('doknr')}-{i}")
+            root.append(norm_copy)
+
+    tree.write(out_path, encoding="UTF-8", xml_declaration=True)
+
+
+def _measure_parse_law(xml_path, streaming, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        law = parse_law(xml_path, streaming=streaming)
+        timings.append(time.perf_counter() - start)
+        norms = len(law["contents"]) + 1
+        del law
+
+    return {"norms": norms, "seconds": min(timings), "peak_rss_mb": rss_mb(peak=True)}
+
+
+def _run_in_fresh_process(fn, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def run_suite(output_path=None, compare_to=None, scales=DEFAULT_SCALES, repeat=3, threshold=DEFAULT_THRESHOLD):
+    location = LocalPathLocation(FIXTURES_DIR)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for slug in sorted(os.listdir(FIXTURES_DIR)):
+            for scale in scales:
+                xml_path = location.xml_file_for(slug)
+                if scale > 1:
+                    xml_path = os.path.join(tmp_dir, f"{slug}_x{scale}.xml")
+                    # Keep the enlarged tree out of this process' memory.
+                    _run_in_fresh_process(enlarge_law_xml, location.xml_file_for(slug), scale, xml_path)
+
+                for mode in ("in-memory", "streaming"):
+                    measurement = _run_in_fresh_process(_measure_parse_law, xml_path, mode == "streaming", repeat)
+                    result = {
+                        "case": f"{slug} x{scale} {mode}",
+                        "law": slug,
+                        "scale": scale,
+                        "mode": mode,
+                        **measurement,
+                        "norms_per_second": measurement["norms"] / measurement["seconds"],
+                    }
+                    results.append(result)
+                    print(
+                        f"{result['case']:28} {result['norms']:7} norms  {result['seconds'] * 1000:9.1f} ms  "
+                        f"{result['norms_per_second']:8.0f} norms/s  {result['peak_rss_mb']:7.1f} MB peak RSS"
+                    )
+
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "lxml": ".".join(str(v) for v in etree.LXML_VERSION),
+        "results": results,
+    }
+
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output_path}")
+
+    regressions = []
+    if compare_to:
+        with open(compare_to) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline["results"], results, threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions compared to {compare_to}")
+
+    return report, regressions
+
+
+def compare_results(baseline_results, results, threshold=DEFAULT_THRESHOLD):
+    """List cases that got slower or use more memory than in the baseline by more than `threshold`."""
+    baseline_by_case = {result["case"]: result for result in baseline_results}
+    regressions = []
+
+    for result in results:
+        baseline = baseline_by_case.get(result["case"])
+        if not baseline:
+            continue
+
+        if result["norms_per_second"] < baseline["norms_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{result['case']}: {baseline['norms_per_second']:.0f} -> {result['norms_per_second']:.0f} norms/s"
+            )
+        if result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + threshold):
+            regressions.append(
+                f"{result['case']}: {baseline['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB peak RSS"
+            )
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, help="Take the best of this many runs per case")
+    parser.add_argument("--suite", action="store_true", help="Run the full suite instead of the microbenchmark")
+    parser.add_argument("--output", help="Suite: write results to this JSON file")
+    parser.add_argument("--compare-to", help="Suite: flag regressions against this earlier results file")
+    parser.add_argument(
+        "--scales", default=",".join(str(s) for s in DEFAULT_SCALES),
+        help="Suite: comma-separated factors to enlarge each law by"
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Suite: regression threshold")
+    args = parser.parse_args()
+
+    if args.suite:
+        _, regressions = run_suite(
+            args.output, args.compare_to, [int(s) for s in args.scales.split(",")], args.repeat or 3, args.threshold
+        )
+        sys.exit(1 if regressions else 0)
+    else:
+        run(args.repeat or 5)
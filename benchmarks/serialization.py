@@ -0,0 +1,67 @@
+"""
+Benchmark for serializing norm text (Content, TOC, Footnotes) with its inner XML tags preserved.
+
+Compares the current `parsing._text` against the previous implementation, which serialized every child element
+separately, on a BGB-sized law (estg with its body norms repeated until it has ~2,700 norms). Also checks that both
+produce identical output.
+
+Run with `python -m benchmarks.serialization` (or `inv bench.serialization`).
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import time
+
+from lxml import etree
+
+from rip_api.gesetze_im_internet import parsing
+from rip_api.gesetze_im_internet.download import LocalPathLocation
+from .parsing import FIXTURES_DIR, enlarge_law_xml
+
+
+def _element_text_with_tags_per_child(element):
+    """Previous implementation: one `etree.tostring` call per child element."""
+    return "".join(
+        itertools.chain([element.text or ""], (etree.tostring(child, encoding="unicode") for child in element))
+    ).strip()
+
+
+def _time(fn, elements, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for element in elements:
+            fn(element)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(slug="estg", scale=10, repeat=5):
+    location = LocalPathLocation(FIXTURES_DIR)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_path = os.path.join(tmp_dir, f"{slug}_x{scale}.xml")
+        enlarge_law_xml(location.xml_file_for(slug), scale, xml_path)
+        elements = list(etree.parse(xml_path).iter("Content", "TOC", "Footnotes"))
+
+    for element in elements:
+        expected = _element_text_with_tags_per_child(element)
+        actual = parsing._text([element])
+        assert (actual or "") == expected.strip(), f"Output differs for {etree.tostring(element)[:200]}"
+
+    before = _time(_element_text_with_tags_per_child, elements, repeat)
+    after = _time(lambda element: parsing._text([element]), elements, repeat)
+
+    print(f"{slug} x{scale}: {len(elements)} text elements, output identical")
+    print(f"per-child serialization  {before * 1000:8.1f} ms")
+    print(f"current                  {after * 1000:8.1f} ms  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--law", default="estg", help="Fixture law to enlarge")
+    parser.add_argument("--scale", type=int, default=10, help="Factor to enlarge the law by")
+    parser.add_argument("--repeat", type=int, default=5, help="Take the best of this many runs")
+    args = parser.parse_args()
+    run(args.law, args.scale, args.repeat)
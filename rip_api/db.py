@@ -3,10 +3,11 @@ import dataclasses
 import math
 import os
 import re
+import time
 import typing
 
-from sqlalchemy import create_engine, func, literal, text, column
-from sqlalchemy.orm import joinedload, load_only, sessionmaker, aliased
+from sqlalchemy import create_engine, exc, func, literal, text, column
+from sqlalchemy.orm import joinedload, selectinload, sessionmaker, aliased
 
 from .models import slugify, Base, Law, ContentItem
 
@@ -28,6 +29,18 @@ db_uri = os.environ.get("DB_URI") or "postgresql://localhost:5432/rip_api"
 _engine = create_engine(db_uri)
 Session = sessionmaker(bind=_engine)
 
+# The tables laws are stored in, in foreign key order.
+LAW_TABLES = [Law.__tablename__, ContentItem.__tablename__]
+SHADOW_SCHEMA = "ingest_shadow"
+RETIRED_SCHEMA = "ingest_retired"
+# How long the swap may wait for readers to release the tables before it gives up and retries, so that a long
+# running query doesn't make all other readers queue up behind the swap.
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_ATTEMPTS = 5
+INDEX_MAINTENANCE_WORK_MEM = "256MB"
+
+BULK_DELETE_CHUNK_SIZE = 500
+
 
 def init_db():
     Base.metadata.create_all(_engine)
@@ -47,6 +60,151 @@ def session_scope():
         session.close()
 
 
+@contextmanager
+def search_indexes_dropped(session):
+    """
+    Drop the GIN search indexes of the law tables for the duration of the block, and rebuild them afterwards. Work the
+    block leaves uncommitted is committed before the rebuild, or rolled back if the block raises. For bulk loads, where
+    building the indexes once is much faster than updating them row by row. Full-text search is slow until the indexes
+    are back.
+
+    Yields a dict, in which "rebuild_seconds" is set once the indexes have been rebuilt.
+    """
+    indexes = session.execute(text("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = ANY(:tables) AND indexdef LIKE '% USING gin %'
+        ORDER BY indexname
+    """), {"tables": LAW_TABLES}).fetchall()
+    for index in indexes:
+        session.execute(f'DROP INDEX "{index.indexname}"')
+    session.commit()
+
+    timing = {}
+    try:
+        yield timing
+    except BaseException:
+        session.rollback()
+        raise
+    else:
+        session.commit()
+    finally:
+        # Whether or not the block succeeded, the indexes must come back.
+        print(f"Rebuilding {len(indexes)} search indexes")
+        start = time.perf_counter()
+        session.execute(f"SET LOCAL maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+        for index in indexes:
+            session.execute(index.indexdef)
+        session.commit()
+        timing["rebuild_seconds"] = time.perf_counter() - start
+        print(f"Rebuilt search indexes in {timing['rebuild_seconds']:.1f}s")
+
+
+def _live_table_ddl(connection, schema):
+    """Statements that recreate the constraints and indexes of the live tables, in an order that works."""
+    constraints = connection.execute(text("""
+        SELECT conrelid::regclass::text AS table_name, conname, contype, pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE connamespace = CAST(:schema AS regnamespace) AND conrelid::regclass::text = ANY(:tables)
+    """), schema=schema, tables=LAW_TABLES).fetchall()
+    indexes = connection.execute(text("""
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = :schema AND tablename = ANY(:tables) AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE connamespace = CAST(:schema AS regnamespace)
+        )
+        ORDER BY indexname
+    """), schema=schema, tables=LAW_TABLES).fetchall()
+
+    # Foreign keys need the primary keys they reference.
+    constraints = sorted(constraints, key=lambda c: (c.contype == "f", c.table_name, c.conname))
+    return [
+        f'ALTER TABLE {c.table_name} ADD CONSTRAINT "{c.conname}" {c.definition}' for c in constraints
+    ] + [
+        indexdef.replace(f" ON {schema}.", " ON ", 1) for indexdef, in indexes
+    ]
+
+
+def _create_shadow_tables(connection, schema):
+    connection.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+    connection.execute(f"CREATE SCHEMA {SHADOW_SCHEMA}")
+    for table in LAW_TABLES:
+        # Columns only: no constraints or indexes, those are built after loading.
+        connection.execute(f"CREATE TABLE {SHADOW_SCHEMA}.{table} (LIKE {schema}.{table} INCLUDING GENERATED)")
+        # Own sequence, so that it moves along with the table.
+        connection.execute(f"CREATE SEQUENCE {SHADOW_SCHEMA}.{table}_id_seq OWNED BY {SHADOW_SCHEMA}.{table}.id")
+        connection.execute(
+            f"ALTER TABLE {SHADOW_SCHEMA}.{table} ALTER COLUMN id SET DEFAULT nextval('{SHADOW_SCHEMA}.{table}_id_seq')"
+        )
+
+
+def _swap_shadow_tables(connection, schema):
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            with connection.begin():
+                connection.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+                connection.execute(f"DROP SCHEMA IF EXISTS {RETIRED_SCHEMA} CASCADE")
+                connection.execute(f"CREATE SCHEMA {RETIRED_SCHEMA}")
+                for table in reversed(LAW_TABLES):
+                    connection.execute(f"ALTER TABLE {schema}.{table} SET SCHEMA {RETIRED_SCHEMA}")
+                for table in LAW_TABLES:
+                    connection.execute(f"ALTER TABLE {SHADOW_SCHEMA}.{table} SET SCHEMA {schema}")
+                connection.execute(f"DROP SCHEMA {RETIRED_SCHEMA} CASCADE")
+                connection.execute(f"DROP SCHEMA {SHADOW_SCHEMA}")
+            return
+        except exc.OperationalError as e:
+            if "lock timeout" not in str(e) or attempt == SWAP_ATTEMPTS:
+                raise
+            print(f"Timed out waiting for readers to release the tables, retrying ({attempt}/{SWAP_ATTEMPTS})")
+
+
+@contextmanager
+def shadow_session_scope():
+    """
+    Provide a session on empty copies of the laws and content_items tables, in a separate schema.
+
+    When the block completes, the copies get the same constraints and indexes as the live tables (building them in
+    one go is much faster than maintaining them row by row), then replace the live tables in a single transaction.
+    Sessions from `session_scope` keep reading the live tables until then. If the block raises, the copies are
+    dropped and the live tables are left alone.
+
+    Commits within the block don't affect the live tables.
+    """
+    with _engine.connect() as connection:
+        schema = connection.execute(text("SELECT current_schema()")).scalar()
+        with connection.begin():
+            ddl = _live_table_ddl(connection, schema)
+            _create_shadow_tables(connection, schema)
+            connection.execute(f"SET search_path TO {SHADOW_SCHEMA}")
+
+        session = Session(bind=connection)
+        try:
+            yield session
+            session.commit()
+            session.close()
+
+            print("Building constraints and indexes on the new tables")
+            start = time.perf_counter()
+            with connection.begin():
+                connection.execute(f"SET LOCAL maintenance_work_mem = '{INDEX_MAINTENANCE_WORK_MEM}'")
+                for statement in ddl:
+                    connection.execute(statement)
+                for table in LAW_TABLES:
+                    connection.execute(f"ANALYZE {table}")
+            print(f"Built constraints and indexes in {time.perf_counter() - start:.1f}s")
+
+            with connection.begin():
+                connection.execute(f"SET search_path TO {schema}")
+            _swap_shadow_tables(connection, schema)
+        except:  # noqa
+            session.rollback()
+            session.close()
+            with connection.begin():
+                connection.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+            raise
+        finally:
+            with connection.begin():
+                connection.execute("RESET search_path")
+
+
 class QueryItemProvider:
     def __init__(self, query):
         self.query = query
@@ -99,6 +257,30 @@ def all_laws(session):
     return session.query(Law).all()
 
 
+def all_law_ids(session):
+    return [law_id for law_id, in session.query(Law.id).order_by(Law.id)]
+
+
+def iter_laws_with_contents(session, law_ids=None, chunk_size=20):
+    """
+    Yield all laws (or those with `law_ids`), ordered by id, with their contents loaded. Laws are loaded
+    `chunk_size` at a time, and expunged from the session (along with their contents) before the next chunk, so
+    memory use doesn't grow with the number of laws. Other objects in the session are left alone.
+    """
+    law_ids = sorted(law_ids) if law_ids is not None else all_law_ids(session)
+    for i in range(0, len(law_ids), chunk_size):
+        laws = (
+            session.query(Law)
+            .options(selectinload(Law.contents))
+            .filter(Law.id.in_(law_ids[i:i + chunk_size]))
+            .order_by(Law.id)
+            .all()
+        )
+        yield from laws
+        for law in laws:
+            session.expunge(law)
+
+
 def all_laws_paginated(session, page, per_page):
     item_provider = QueryItemProvider(session.query(Law))
     return paginate(item_provider, page, per_page)
@@ -109,7 +291,8 @@ def all_gii_slugs(session):
 
 
 def all_laws_load_only_gii_slug_and_source_timestamp(session):
-    return session.query(Law).options(load_only("gii_slug", "source_timestamp")).all()
+    # Plain rows rather than Law objects, which would stay in the session's identity map.
+    return session.query(Law.gii_slug, Law.source_timestamp, Law.location_timestamp, Law.source_hash).all()
 
 
 def laws_with_duplicate_slugs(session):
@@ -146,8 +329,29 @@ def find_content_item_by_id_and_law_slug(session, content_item_id, law_slug):
     )
 
 
-def bulk_delete_laws_by_gii_slug(session, gii_slugs):
-    Law.__table__.delete().where(Law.gii_slug.in_(gii_slugs))
+def bulk_delete_laws_by_gii_slug(session, gii_slugs, chunk_size=BULK_DELETE_CHUNK_SIZE):
+    """
+    Delete the laws with the given gii_slugs, `chunk_size` per statement. Their content items are deleted by the DB
+    (ON DELETE CASCADE), without loading anything into the session.
+
+    Returns a dict with the number of laws and content items deleted, and the seconds it took.
+    """
+    gii_slugs = sorted(gii_slugs)
+    deleted = {"laws": 0, "content_items": 0}
+    start = time.perf_counter()
+
+    for i in range(0, len(gii_slugs), chunk_size):
+        # The SELECT still sees the content items, the cascade only happens at the end of the statement.
+        laws, content_items = session.execute(text("""
+            WITH deleted AS (DELETE FROM laws WHERE gii_slug = ANY(:gii_slugs) RETURNING id)
+            SELECT
+                (SELECT count(*) FROM deleted),
+                (SELECT count(*) FROM content_items WHERE law_id IN (SELECT id FROM deleted))
+        """), {"gii_slugs": gii_slugs[i:i + chunk_size]}).fetchone()
+        deleted["laws"] += laws
+        deleted["content_items"] += content_items
+
+    return {**deleted, "seconds": time.perf_counter() - start}
 
 
 def _find_law_exact_match(session, query):
@@ -1,16 +1,29 @@
+import collections
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import contextlib
 import gzip
+import hashlib
 import json
+import multiprocessing
 import os
+import shutil
 import sys
 import tarfile
 import tempfile
+import textwrap
+import time
+import zlib
 
-import boto3
 import tqdm
 
 from rip_api import ASSET_BUCKET, api_schemas, db, models
+from . import copy_loader, diff_loader, download, s3_transfer
 from .parsing import parse_law
-from .download import fetch_toc, has_update
+from .utils import rss_mb
+from .download import (
+    DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_SECOND, TOC_URL, Fetcher, fetch_toc_incrementally, location_from_string,
+    spool_chunks, validators_from_timestamp
+)
 
 
 def _calculate_diff(previous_slugs, current_slugs):
@@ -28,12 +41,15 @@ def _calculate_diff(previous_slugs, current_slugs):
     return existing, new, removed
 
 
-def _loop_with_progress(slugs, desc):
+def _loop_with_progress(slugs, desc, total=None, position=None):
+    if total is None:
+        total = len(slugs)
+
     pbar = None
     if sys.stdout.isatty():
-        pbar = tqdm.tqdm(total=len(slugs), desc=desc)
+        pbar = tqdm.tqdm(total=total, desc=desc, position=position)
     else:
-        print(desc, '-', len(slugs))
+        print(desc, '-', total)
 
     for slug in slugs:
         yield slug
@@ -44,19 +60,44 @@ def _loop_with_progress(slugs, desc):
         pbar.close()
 
 
-def _check_for_updates(slugs, check_fn):
+def _run_concurrently(fn, slugs, concurrency):
+    """Yield (slug, fn(slug)) for each slug, in order of completion when running in more than one thread."""
+    if concurrency <= 1:
+        for slug in slugs:
+            yield slug, fn(slug)
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(fn, slug): slug for slug in slugs}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Don't start any more work if a call failed.
+            for future in futures:
+                future.cancel()
+
+
+def _check_for_updates(slugs, check_fn, concurrency=1):
     updated = set()
 
-    for slug in _loop_with_progress(slugs, "Checking existing laws for updates"):
-        if check_fn(slug):
+    results = _run_concurrently(check_fn, slugs, concurrency)
+    for slug, is_updated in _loop_with_progress(results, "Checking existing laws for updates", total=len(slugs)):
+        if is_updated:
             updated.add(slug)
 
     return updated
 
 
-def _add_or_replace(slugs, add_fn):
-    for slug in _loop_with_progress(slugs, "Adding new and updated laws"):
-        add_fn(slug)
+def _add_or_replace(slugs, add_fn, concurrency=1):
+    """Run `add_fn` for all slugs, returning a Counter of the results it returned."""
+    results_count = collections.Counter()
+
+    results = _run_concurrently(add_fn, slugs, concurrency)
+    for _, result in _loop_with_progress(results, "Adding new and updated laws", total=len(slugs)):
+        results_count[result] += 1
+
+    return results_count
 
 
 def _delete_removed(slugs, delete_fn):
@@ -64,20 +105,74 @@ def _delete_removed(slugs, delete_fn):
         delete_fn(slug)
 
 
-def download_laws(location):
-    print("Fetching toc.xml")
-    download_urls = fetch_toc()
+def download_laws(
+    location, concurrency=DEFAULT_CONCURRENCY, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, toc_url=TOC_URL,
+    recheck_after=None
+):
+    """
+    Download new and updated laws from gesetze-im-internet.de into `location`, and remove laws that are gone.
 
-    print("Loading timestamps")
+    Requests are conditional on the toc's and each law's stored validators. With `recheck_after` (seconds), laws that
+    were checked more recently than that are skipped. Up to `concurrency` requests run at once, at most
+    `requests_per_second` per host.
+
+    Returns a dict of counts: laws downloaded, modified but identical, not modified, skipped as recently checked,
+    and removed.
+    """
+    fetcher = Fetcher(concurrency, requests_per_second)
+
+    print("Loading manifest")
     laws_on_disk = location.list_slugs_with_timestamps()
+    previous_toc_state = location.toc_state()
+
+    print("Fetching toc.xml")
+    download_urls, toc_state, toc_changed = fetch_toc_incrementally(fetcher, toc_url, previous_toc_state)
+    print("Toc changed" if toc_changed else "Toc unchanged")
+
     existing, new, removed = _calculate_diff(laws_on_disk.keys(), download_urls.keys())
 
-    updated = _check_for_updates(existing, lambda slug: has_update(download_urls[slug], laws_on_disk[slug]))
-    new_or_updated = new.union(updated)
+    # Laws whose download URL moved can't be checked with the validators from the old URL.
+    previous_urls = previous_toc_state["laws"] if previous_toc_state else download_urls
+    moved = {slug for slug in existing if previous_urls.get(slug) != download_urls[slug]}
 
-    _add_or_replace(new_or_updated, lambda slug: location.create_or_replace_law(slug, download_urls[slug]))
+    skipped = set()
+    if recheck_after is not None:
+        checked_since = time.time() - recheck_after
+        skipped = {
+            slug for slug in existing - moved if (location.checked_at(slug) or 0) > checked_since
+        }
+        print(f"Skipping {len(skipped)} laws checked within the last {recheck_after} seconds")
 
-    _delete_removed(removed, lambda slug: location.remove_law(slug))
+    def add_fn(slug):
+        validators = None
+        if slug in existing and slug not in moved:
+            validators = location.validators_for(slug) or validators_from_timestamp(laws_on_disk[slug])
+        return location.create_or_replace_law(slug, download_urls[slug], fetcher, validators)
+
+    try:
+        results = _add_or_replace(new.union(existing) - skipped, add_fn, concurrency)
+        print(
+            f"Downloaded {results[download.DOWNLOADED]} new or updated laws, "
+            f"{results[download.IDENTICAL]} modified but identical, {results[download.NOT_MODIFIED]} not modified"
+        )
+        print(f"Fetcher: {fetcher.summary()}")
+
+        _delete_removed(removed, lambda slug: location.remove_law(slug))
+
+        # Only now that all toc changes have been applied.
+        location.set_toc_state(toc_state)
+    finally:
+        # Also record the laws that were downloaded before an error.
+        print("Saving manifest")
+        location.save_manifest()
+
+    return {
+        "downloaded": results[download.DOWNLOADED],
+        "identical": results[download.IDENTICAL],
+        "not_modified": results[download.NOT_MODIFIED],
+        "skipped": len(skipped),
+        "removed": len(removed),
+    }
 
 
 def _fixup_slug_duplicates(session):
@@ -98,43 +193,387 @@ def _fixup_slug_duplicates(session):
     session.commit()
 
 
-def ingest_data_from_location(session, location):
+def _laws_to_ingest(session, location):
+    """Slugs of the laws that are new or updated in `location`, slugs of removed laws, and the DB's XML hashes."""
     print("Loading timestamps")
     laws_on_disk = location.list_slugs_with_timestamps()
-    laws_in_db = {
-        law.gii_slug: law.source_timestamp
-        for law in db.all_laws_load_only_gii_slug_and_source_timestamp(session)
-    }
+    laws_in_db = {}
+    hashes_in_db = {}
+    for law in db.all_laws_load_only_gii_slug_and_source_timestamp(session):
+        # Laws ingested before location timestamps were stored only have the XML's builddate.
+        laws_in_db[law.gii_slug] = law.location_timestamp or law.source_timestamp
+        hashes_in_db[law.gii_slug] = law.source_hash
     existing, new, removed = _calculate_diff(laws_in_db.keys(), laws_on_disk.keys())
 
     updated = _check_for_updates(existing, lambda slug: laws_on_disk[slug] > laws_in_db[slug])
-    new_or_updated = new.union(updated)
-
-    def add_fn(slug):
-        ingest_law(session, location, slug)
+    return new.union(updated), removed, hashes_in_db
+
+
+def _store_laws(
+    session, location, slugs, known_hashes, workers=1, parse_cache=None, use_copy=False, batch_size=1,
+    desc="Adding new and updated laws", position=None
+):
+    """Parse and store the laws `slugs`, committing every `batch_size` laws. Returns stats and the peak RSS."""
+    stats = collections.Counter(stored=0, unchanged=0, cache_hit=0, cache_miss=0)
+    peak_rss_mb = rss_mb()
+    store_law = copy_loader.store_law if use_copy else diff_loader.store_law
+    timestamps = location.list_slugs_with_timestamps()
+    laws_in_batch = 0
+
+    def commit_batch():
+        nonlocal laws_in_batch, peak_rss_mb
         session.commit()
+        session.expunge_all()
+        laws_in_batch = 0
+        peak_rss_mb = max(peak_rss_mb, rss_mb())
+
+    parsed_laws = _parse_laws(location, slugs, workers, known_hashes, parse_cache)
+    for parsed in _loop_with_progress(parsed_laws, desc, total=len(slugs), position=position):
+        if parsed.cache_status:
+            stats[parsed.cache_status] += 1
+        if parsed.law_dict is None:
+            _update_unchanged_law(session, parsed, timestamps[parsed.gii_slug])
+            stats["unchanged"] += 1
+        else:
+            store_law(
+                session, parsed.law_dict, parsed.gii_slug, parsed.attachment_names, parsed.source_hash,
+                timestamps[parsed.gii_slug]
+            )
+            stats["stored"] += 1
+        laws_in_batch += 1
+        if laws_in_batch >= batch_size:
+            commit_batch()
+    if laws_in_batch:
+        commit_batch()
+
+    return stats, peak_rss_mb
+
+
+def _shard_slugs(slugs, shards):
+    """Split slugs into `shards` lists by a hash of the slug, so a law always ends up in the same shard."""
+    sharded = [[] for _ in range(shards)]
+    for slug in sorted(slugs):
+        sharded[zlib.crc32(slug.encode("utf-8")) % shards].append(slug)
+    return sharded
+
+
+def _ingest_shard(shard, shards, location_string, slugs, known_hashes, parse_cache, use_copy, batch_size):
+    # Runs in a freshly spawned process, which has its own DB engine and so its own connection.
+    location = location_from_string(location_string)
+    with db.session_scope() as session:
+        return _store_laws(
+            session, location, slugs, known_hashes, parse_cache=parse_cache, use_copy=use_copy, batch_size=batch_size,
+            desc=f"Adding laws (shard {shard + 1}/{shards})", position=shard
+        )
+
+
+def _store_laws_sharded(location, slugs, known_hashes, shards, parse_cache=None, use_copy=False, batch_size=1):
+    # Spawn rather than fork, so that workers don't inherit the parent's pooled DB connections.
+    with ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(
+                _ingest_shard, shard, shards, location.location_string, shard_slugs,
+                {slug: known_hashes[slug] for slug in shard_slugs if slug in known_hashes},
+                parse_cache, use_copy, batch_size
+            )
+            for shard, shard_slugs in enumerate(_shard_slugs(slugs, shards))
+        ]
+        results = [future.result() for future in futures]
+
+    return sum((stats for stats, _ in results), collections.Counter()), max(rss for _, rss in results)
+
+
+def ingest_data_from_location(
+    session, location, workers=1, parse_cache=None, use_copy=False, batch_size=1, shards=1, drop_search_indexes=False
+):
+    """
+    Bring the DB up to date with the laws in `location`, skipping laws whose XML hash hasn't changed.
+
+    With `workers` > 1, laws are parsed in that many processes; with `shards` > 1, they're instead split between that
+    many processes which each parse and write their share. `use_copy` replaces laws with COPY rather than diffing them
+    (see `copy_loader`), and `drop_search_indexes` rebuilds the search indexes once at the end instead of updating
+    them. Laws are committed `batch_size` at a time.
+
+    Returns counts of laws stored, unchanged and removed and of parse cache hits and misses, the peak RSS in MB, and
+    the time it took to rebuild the search indexes, if they were dropped.
+    """
+    new_or_updated, removed, hashes_in_db = _laws_to_ingest(session, location)
+    slugs = sorted(new_or_updated)
+
+    drop_search_indexes = drop_search_indexes and bool(slugs)
+    with db.search_indexes_dropped(session) if drop_search_indexes else contextlib.nullcontext({}) as index_timing:
+        if shards > 1:
+            # Don't sit in an open transaction while the shards work.
+            session.commit()
+            stats, peak_rss_mb = _store_laws_sharded(
+                location, slugs, hashes_in_db, shards, parse_cache=parse_cache, use_copy=use_copy,
+                batch_size=batch_size
+            )
+        else:
+            stats, peak_rss_mb = _store_laws(
+                session, location, slugs, hashes_in_db, workers=workers, parse_cache=parse_cache, use_copy=use_copy,
+                batch_size=batch_size
+            )
+
+    print(f"Stored {stats['stored']} laws, skipped {stats['unchanged']} with unchanged XML")
+    print(f"Peak RSS while storing laws: {peak_rss_mb:.0f} MB")
+    if parse_cache:
+        print(f"Parse cache: {stats['cache_hit']} hits, {stats['cache_miss']} misses")
 
-    _add_or_replace(new_or_updated, add_fn)
     _fixup_slug_duplicates(session)
 
     print("Deleting removed laws")
-    db.bulk_delete_laws_by_gii_slug(session, removed)
+    deleted = db.bulk_delete_laws_by_gii_slug(session, removed)
+    session.commit()
+    print(
+        f"Deleted {deleted['laws']} laws and {deleted['content_items']} content items in {deleted['seconds']:.1f}s"
+    )
+
+    return {
+        **stats,
+        "removed": deleted["laws"],
+        "peak_rss_mb": peak_rss_mb,
+        "index_rebuild_seconds": index_timing.get("rebuild_seconds"),
+    }
+
+
+RUN_PHASE_INGEST = "ingest"
+RUN_PHASE_BULK_FILES = "bulk_files"
+RUN_PHASE_DONE = "done"
+RUN_PHASE_SUPERSEDED = "superseded"
+
+# Seconds an invocation keeps in reserve when ingesting: enough to store one more batch, commit and hand over.
+DEFAULT_RUN_RESERVE_SECONDS = 120
+# Seconds an invocation needs left to generate and upload the bulk law files.
+DEFAULT_BULK_FILES_SECONDS = 600
+
+
+def start_ingest_run(session, location):
+    """
+    Journal a new ingest run for the laws in `location` that are new, updated or removed, and return its id. Any
+    unfinished earlier run is superseded, as the new run covers its remaining laws.
+    """
+    new_or_updated, removed, _ = _laws_to_ingest(session, location)
+
+    session.query(models.IngestRun).filter(
+        models.IngestRun.phase.in_([RUN_PHASE_INGEST, RUN_PHASE_BULK_FILES])
+    ).update({"phase": RUN_PHASE_SUPERSEDED}, synchronize_session=False)
+    run = models.IngestRun(
+        phase=RUN_PHASE_INGEST, pending_slugs=sorted(new_or_updated), removed_slugs=sorted(removed), stats={}
+    )
+    session.add(run)
+    session.commit()
+
+    print(f"Started ingest run {run.id}: {len(run.pending_slugs)} laws to store, {len(run.removed_slugs)} to delete")
+    return run.id
+
+
+def _store_run_batch(session, location, run, batch_size):
+    batch = run.pending_slugs[:batch_size]
+    hashes_in_db = dict(
+        session.query(models.Law.gii_slug, models.Law.source_hash).filter(models.Law.gii_slug.in_(batch))
+    )
+
+    timestamps = location.list_slugs_with_timestamps()
+
+    stats = collections.Counter(run.stats)
+    for parsed in _parse_laws(location, batch, workers=1, known_hashes=hashes_in_db):
+        if parsed.law_dict is None:
+            _update_unchanged_law(session, parsed, timestamps[parsed.gii_slug])
+            stats["unchanged"] += 1
+            continue
+        diff_loader.store_law(
+            session, parsed.law_dict, parsed.gii_slug, parsed.attachment_names, parsed.source_hash,
+            timestamps[parsed.gii_slug]
+        )
+        stats["stored"] += 1
+
+    # Committed together with the laws, so that the journal always matches the DB.
+    run.pending_slugs = run.pending_slugs[len(batch):]
+    run.stats = dict(stats)
     session.commit()
 
 
-def ingest_law(session, location, gii_slug):
-    law_dict = parse_law(location.xml_file_for(gii_slug))
+def continue_ingest_run(
+    session, location, run_id, time_remaining, invoke, batch_size=50, reserve_seconds=DEFAULT_RUN_RESERVE_SECONDS,
+    bulk_files_seconds=DEFAULT_BULK_FILES_SECONDS, generate_bulk_files=None
+):
+    """
+    Work on ingest run `run_id` for as long as `time_remaining()` (in seconds) allows, committing progress to the
+    journal after every batch of laws. If the run isn't done by then, `invoke({"run_id": run_id})` is called, which
+    should arrange for this function to be called again (e.g. by invoking the Lambda function anew).
+
+    Once all laws are stored, removed laws are deleted, and then the bulk law files are generated with
+    `generate_bulk_files` (default: `generate_and_upload_bulk_law_files`).
+
+    Returns the run's phase.
+    """
+    generate_bulk_files = generate_bulk_files or generate_and_upload_bulk_law_files
+
+    while True:
+        # Locking the run keeps a run that's being superseded from storing laws alongside its successor.
+        run = session.query(models.IngestRun).filter_by(id=run_id).with_for_update().one()
+
+        if run.phase == RUN_PHASE_INGEST and run.pending_slugs:
+            if time_remaining() <= reserve_seconds:
+                break
+            _store_run_batch(session, location, run, batch_size)
+            print(f"Ingest run {run_id}: {len(run.pending_slugs)} laws pending")
+        elif run.phase == RUN_PHASE_INGEST:
+            deleted = db.bulk_delete_laws_by_gii_slug(session, run.removed_slugs)
+            run.stats = {**run.stats, "removed": deleted["laws"]}
+            run.phase = RUN_PHASE_BULK_FILES
+            _fixup_slug_duplicates(session)
+            session.commit()
+        elif run.phase == RUN_PHASE_BULK_FILES:
+            if time_remaining() < bulk_files_seconds:
+                break
+            generate_bulk_files(session)
+            run.phase = RUN_PHASE_DONE
+            session.commit()
+            print(f"Ingest run {run_id} done: {run.stats}")
+        else:
+            session.commit()
+            return run.phase
+
+    phase = run.phase
+    session.commit()
+    print(f"Ingest run {run_id}: handing over to the next invocation in phase {phase}")
+    invoke({"run_id": run_id})
+    return phase
+
+
+def rebuild_from_location(location, workers=1, parse_cache=None, batch_size=1):
+    """
+    Ingest all laws in `location` into new, empty tables, and replace the live tables with them once done (see
+    `db.shadow_session_scope`). Unlike `ingest_data_from_location`, readers never see a partially ingested state,
+    and the search indexes are built in one go rather than updated law by law.
+
+    Returns the same stats as `ingest_data_from_location`.
+    """
+    with db.shadow_session_scope() as session:
+        return ingest_data_from_location(
+            session, location, workers=workers, parse_cache=parse_cache, use_copy=True, batch_size=batch_size
+        )
+
+
+ParsedLaw = collections.namedtuple(
+    "ParsedLaw", ["gii_slug", "law_dict", "attachment_names", "source_hash", "cache_status"]
+)
+
+
+# Streamed XML larger than this is spooled to disk rather than kept in memory while it's being hashed and parsed.
+XML_SPOOL_MAX_MEMORY = 1024 * 1024
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+@contextlib.contextmanager
+def _hashed_xml(location, gii_slug):
+    """
+    Yield the SHA-256 hex digest of a law's XML and something to parse the XML from.
+
+    XML files on disk are simply read twice, once for hashing and once for parsing. Streams (zip members, S3) are
+    copied into memory or a temp file while hashing, so that they're only read once from the location.
+    """
+    xml_file = location.xml_file_for(gii_slug)
+    hasher = hashlib.sha256()
+
+    if not hasattr(xml_file, "read"):
+        with open(xml_file, "rb") as f:
+            for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        yield hasher.hexdigest(), xml_file
+        return
+
+    def hashed_chunks():
+        for chunk in iter(lambda: xml_file.read(_READ_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            yield chunk
+
+    with contextlib.closing(xml_file):
+        spooled = spool_chunks(hashed_chunks(), XML_SPOOL_MAX_MEMORY)
+    with spooled:
+        yield hasher.hexdigest(), spooled
+
+
+def _update_unchanged_law(session, parsed, location_timestamp):
+    """
+    Bring a law whose XML didn't change up to date with the location: attachments may have changed regardless, and
+    the new location timestamp keeps the law from being read again until it's downloaded anew.
+    """
+    session.query(models.Law).filter_by(gii_slug=parsed.gii_slug).update(
+        {"attachment_names": parsed.attachment_names, "location_timestamp": location_timestamp},
+        synchronize_session=False
+    )
+
+
+def _parse_law_from_location(location, gii_slug, known_hash=None, parse_cache=None):
+    """
+    Read and parse a law. If its XML hashes to `known_hash`, it isn't parsed and `law_dict` is None.
+    """
     attachment_names = location.attachment_names(gii_slug)
-    law = models.Law.from_dict(law_dict, gii_slug)
-    law.attachment_names = attachment_names
+    with _hashed_xml(location, gii_slug) as (source_hash, xml_file):
+        if source_hash == known_hash:
+            return ParsedLaw(gii_slug, None, attachment_names, source_hash, None)
 
-    existing_law = db.find_law_by_doknr(session, law.doknr)
-    if existing_law:
-        session.delete(existing_law)
-        session.flush()
-    session.add(law)
+        law_dict = parse_cache and parse_cache.get(source_hash)
+        cache_status = parse_cache and ("cache_hit" if law_dict else "cache_miss")
+        if not law_dict:
+            law_dict = parse_law(xml_file, streaming=True)
+            if parse_cache:
+                parse_cache.put(source_hash, law_dict)
 
-    return law
+    return ParsedLaw(gii_slug, law_dict, attachment_names, source_hash, cache_status)
+
+
+_worker_location = None
+_worker_parse_cache = None
+
+
+def _init_parse_worker(location_string, parse_cache):
+    global _worker_location, _worker_parse_cache
+    # Locations may hold unpicklable clients (e.g. boto3), so each worker builds its own.
+    _worker_location = location_from_string(location_string)
+    _worker_parse_cache = parse_cache
+
+
+def _parse_law_in_worker(gii_slug, known_hash):
+    return _parse_law_from_location(_worker_location, gii_slug, known_hash, _worker_parse_cache)
+
+
+def _parse_laws(location, slugs, workers, known_hashes=None, parse_cache=None):
+    """
+    Yield a `ParsedLaw` for each slug, in order.
+
+    With more than one worker, parsing happens in a process pool. Only a few laws per worker are in flight at any
+    time so that parsed laws don't pile up in memory while the DB writes catch up.
+    """
+    known_hashes = known_hashes or {}
+
+    if workers <= 1:
+        for slug in slugs:
+            yield _parse_law_from_location(location, slug, known_hashes.get(slug), parse_cache)
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_parse_worker, initargs=(location.location_string, parse_cache)
+    ) as executor:
+        pending = collections.deque()
+        for slug in slugs:
+            pending.append(executor.submit(_parse_law_in_worker, slug, known_hashes.get(slug)))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def ingest_law(session, location, gii_slug, parse_cache=None):
+    parsed = _parse_law_from_location(location, gii_slug, parse_cache=parse_cache)
+    return diff_loader.store_law(
+        session, parsed.law_dict, gii_slug, parsed.attachment_names, parsed.source_hash,
+        location.list_slugs_with_timestamps()[gii_slug]
+    )
 
 
 def _write_file(filepath, content):
@@ -142,25 +581,105 @@ def _write_file(filepath, content):
         f.write(content + "\n")
 
 
-def _write_gzipped_file(filepath, content):
-    with gzip.open(filepath, "wb") as f:
-        f.write((content + "\n").encode("utf-8"))
+# The pieces of `json.dumps({"data": [...]}, indent=2)` around and between the list items.
+_JSON_DATA_START = '{\n  "data": [\n'
+_JSON_DATA_END = "\n  ]\n}\n"
+_JSON_DATA_EMPTY = '{\n  "data": []\n}\n'
 
+# Laws per rendering task when writing law JSON files in worker processes.
+LAW_JSON_CHUNK_SIZE = 50
+
+
+def _json_data_item(item, first):
+    return ("" if first else ",\n") + textwrap.indent(json.dumps(item, indent=2), "    ")
+
+
+@contextlib.contextmanager
+def _json_data_writer(f):
+    """
+    Write `{"data": [...]}` to the text file `f` one list item at a time, formatted exactly like
+    `json.dumps(..., indent=2)`. Yields a function that writes an item.
+    """
+    count = 0
+
+    def write_item(item):
+        nonlocal count
+        f.write((_JSON_DATA_START if not count else "") + _json_data_item(item, first=not count))
+        count += 1
+
+    yield write_item
+    f.write(_JSON_DATA_END if count else _JSON_DATA_EMPTY)
 
-def write_all_law_json_files(session, dir_path):
-    laws_path = dir_path + "/laws"
-    os.makedirs(laws_path, exist_ok=True)
 
-    all_laws = []
+def _render_law_json(law, laws_path):
+    """Write the law's JSON file and return its data for all_laws.json.gz."""
+    law_api_model = api_schemas.LawAllFields.from_orm_model(law, include_contents=True)
+    single_law_response = api_schemas.LawResponse(data=law_api_model)
+    _write_file(f"{laws_path}/{law.slug}.json", single_law_response.json(indent=2))
+    return law_api_model.dict()
 
-    for law in db.all_laws(session):
-        law_api_model = api_schemas.LawAllFields.from_orm_model(law, include_contents=True)
-        single_law_response = api_schemas.LawResponse(data=law_api_model)
-        _write_file(f"{laws_path}/{law.slug}.json", single_law_response.json(indent=2))
 
-        all_laws.append(law_api_model.dict())
+def _render_law_json_chunk(dir_path, chunk_index, law_ids):
+    # Runs in a freshly spawned process, with its own DB connection. Writes the chunk's laws, comma-separated, to a
+    # gzip file of its own. Returns its path and the number of laws in it.
+    fragment_path = f"{dir_path}/all_laws.{chunk_index:06}.json.gz.part"
+    count = 0
+    with db.session_scope() as session, gzip.open(fragment_path, "wt", encoding="utf-8") as fragment:
+        for law in db.iter_laws_with_contents(session, law_ids):
+            fragment.write(_json_data_item(_render_law_json(law, f"{dir_path}/laws"), first=not count))
+            count += 1
+    return fragment_path, count
+
+
+def _write_all_law_json_files_in_workers(session, dir_path, workers, chunk_size):
+    law_ids = db.all_law_ids(session)
+    chunks = [law_ids[i:i + chunk_size] for i in range(0, len(law_ids), chunk_size)]
+    # Don't sit in an open transaction while the workers render.
+    session.commit()
+
+    def gzip_member(string):
+        return gzip.compress(string.encode("utf-8"))
+
+    # A sequence of gzip members decompresses to the concatenation of their contents, so the fragments are
+    # appended as they are, in chunk order, with the envelope and separators as members of their own.
+    count = 0
+    with open(f"{dir_path}/all_laws.json.gz", "wb") as all_laws_file:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [
+                executor.submit(_render_law_json_chunk, dir_path, chunk_index, chunk)
+                for chunk_index, chunk in enumerate(chunks)
+            ]
+            for future in _loop_with_progress(futures, "Writing law JSON files"):
+                fragment_path, fragment_count = future.result()
+                if fragment_count:
+                    all_laws_file.write(gzip_member(",\n" if count else _JSON_DATA_START))
+                    with open(fragment_path, "rb") as fragment:
+                        shutil.copyfileobj(fragment, all_laws_file)
+                    count += fragment_count
+                os.remove(fragment_path)
+
+        all_laws_file.write(gzip_member(_JSON_DATA_END if count else _JSON_DATA_EMPTY))
+
+
+def write_all_law_json_files(session, dir_path, workers=1, chunk_size=LAW_JSON_CHUNK_SIZE):
+    """
+    Write a JSON file per law to `dir_path`/laws, and all laws to `dir_path`/all_laws.json.gz.
+
+    With `workers` > 1, laws are rendered in that many processes, `chunk_size` laws at a time, each chunk going
+    into a gzip member of its own in all_laws.json.gz.
+    """
+    laws_path = dir_path + "/laws"
+    os.makedirs(laws_path, exist_ok=True)
+
+    if workers > 1:
+        _write_all_law_json_files_in_workers(session, dir_path, workers, chunk_size)
+        return
 
-    _write_gzipped_file(f"{dir_path}/all_laws.json.gz", json.dumps({'data': all_laws}, indent=2))
+    # Streamed into the gzip file law by law, so that the whole corpus is never in memory at once.
+    with gzip.open(f"{dir_path}/all_laws.json.gz", "wt", encoding="utf-8") as all_laws_file, \
+            _json_data_writer(all_laws_file) as write_law:
+        for law in db.iter_laws_with_contents(session):
+            write_law(_render_law_json(law, laws_path))
 
 
 def write_law_json_file(session, law, dir_path):
@@ -171,17 +690,16 @@ def write_law_json_file(session, law, dir_path):
 
 
 def upload_file_to_s3(local_path, s3_key):
-    s3 = boto3.client("s3")
-    s3.upload_file(local_path, ASSET_BUCKET, s3_key)
+    s3_transfer.upload_file(local_path, ASSET_BUCKET, s3_key)
 
 
-def generate_and_upload_bulk_law_files(session):
+def generate_and_upload_bulk_law_files(session, workers=1):
     tarfilename = "all_laws.tar.gz"
     jsonfilename = "all_laws.json.gz"
 
     with tempfile.TemporaryDirectory() as dir_path:
         print("Generating json files")
-        write_all_law_json_files(session, dir_path)
+        write_all_law_json_files(session, dir_path, workers=workers)
 
         print("Creating tarball")
         tarfilepath = f"{dir_path}/{tarfilename}"
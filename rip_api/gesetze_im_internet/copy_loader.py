@@ -0,0 +1,110 @@
+"""
+Bulk loading of parsed laws with PostgreSQL's COPY, as a faster alternative to the diff-based upsert in `diff_loader`
+for fresh tables.
+
+Ids are reserved from the tables' sequences up front, so that content items can reference their law and parent
+items without a round-trip per row. Produces the same rows as `models.Law.from_dict` + a session flush.
+"""
+import io
+import json
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from rip_api.models import ContentItem, Law, content_item_hash, slugify
+
+
+def _columns(model):
+    # Generated columns (search_tsv) are computed by the DB.
+    return [column for column in model.__table__.columns if column.computed is None]
+
+
+LAW_COLUMNS = _columns(Law)
+CONTENT_ITEM_COLUMNS = _columns(ContentItem)
+
+
+def _escape(string):
+    """Escape a value for COPY's text format."""
+    return string.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _array_literal(values):
+    elements = (
+        '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' for value in values
+    )
+    return "{" + ",".join(elements) + "}"
+
+
+def _copy_value(value, column_type):
+    if value is None:
+        return "\\N"
+    if isinstance(column_type, postgresql.ARRAY):
+        return _escape(_array_literal(value))
+    if isinstance(column_type, postgresql.JSONB):
+        return _escape(json.dumps(value))
+    return _escape(str(value))
+
+
+def _copy_rows(cursor, table, columns, rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(row[column.name], column.type) for column in columns))
+        buf.write("\n")
+    buf.seek(0)
+
+    quoted_columns = ", ".join(f'"{column.name}"' for column in columns)
+    cursor.copy_expert(f"COPY {table} ({quoted_columns}) FROM STDIN", buf)
+
+
+def _reserve_ids(session, table, count):
+    result = session.execute(
+        text(f"SELECT nextval(pg_get_serial_sequence('{table}', 'id')) FROM generate_series(1, :count)"),
+        {"count": count},
+    )
+    return [row[0] for row in result]
+
+
+def store_law(session, law_dict, gii_slug, attachment_names, source_hash=None, location_timestamp=None):
+    """
+    Store a parsed law and its content items, replacing any law with the same doknr. Returns the law's id.
+
+    Runs in the session's transaction, but bypasses the ORM: law objects already loaded into the session aren't
+    updated.
+    """
+    session.execute(text("DELETE FROM laws WHERE doknr = :doknr"), {"doknr": law_dict["doknr"]})
+
+    law_id, = _reserve_ids(session, "laws", 1)
+    content_item_dicts = law_dict["contents"]
+    content_item_ids = _reserve_ids(session, "content_items", len(content_item_dicts)) if content_item_dicts else []
+
+    law_row = {
+        **{key: value for key, value in law_dict.items() if key != "contents"},
+        "id": law_id,
+        "slug": slugify(law_dict["abbreviation"]),
+        "gii_slug": gii_slug,
+        "attachment_names": attachment_names,
+        "source_hash": source_hash,
+        "location_timestamp": location_timestamp,
+    }
+
+    ids_by_doknr = {}
+    content_item_rows = []
+    for order, (content_item_id, item) in enumerate(zip(content_item_ids, content_item_dicts)):
+        ids_by_doknr[item["doknr"]] = content_item_id
+        content_item_rows.append({
+            **{key: value for key, value in item.items() if key != "parent"},
+            "id": content_item_id,
+            "law_id": law_id,
+            "parent_id": item["parent"] and ids_by_doknr[item["parent"]["doknr"]],
+            "order": order,
+            "content_hash": content_item_hash(item),
+        })
+
+    cursor = session.connection().connection.cursor()
+    try:
+        _copy_rows(cursor, "laws", LAW_COLUMNS, [law_row])
+        _copy_rows(cursor, "content_items", CONTENT_ITEM_COLUMNS, content_item_rows)
+    finally:
+        cursor.close()
+
+    return law_id
@@ -0,0 +1,84 @@
+"""
+Storing parsed laws by diffing them against the rows already in the DB, so that re-ingesting a law in which one
+paragraph changed only writes that paragraph, instead of deleting and re-inserting (and re-indexing) every item.
+
+Content items are matched by doknr and compared by their stored `content_hash` (see `models.content_item_hash`).
+Parent and order are compared separately, as they are stored as ids and positions rather than hashed.
+"""
+from sqlalchemy import bindparam, select
+
+from rip_api.models import ContentItem, Law, content_item_hash, slugify
+from .copy_loader import _reserve_ids
+
+laws = Law.__table__
+content_items = ContentItem.__table__
+
+
+def _stored_content_items(session, law_id):
+    columns = [
+        content_items.c.id, content_items.c.doknr, content_items.c.parent_id, content_items.c.order,
+        content_items.c.content_hash
+    ]
+    result = session.execute(select(columns).where(content_items.c.law_id == law_id))
+    return {row.doknr: row for row in result}
+
+
+def store_law(session, law_dict, gii_slug, attachment_names, source_hash=None, location_timestamp=None):
+    """
+    Store a parsed law, updating the law with the same doknr in place if there is one. Returns the law's id.
+
+    Only content items that are new, changed, moved or removed are written. Like `copy_loader.store_law`, this runs
+    in the session's transaction but bypasses the ORM.
+    """
+    law_row = {
+        **{key: value for key, value in law_dict.items() if key != "contents"},
+        "slug": slugify(law_dict["abbreviation"]),
+        "gii_slug": gii_slug,
+        "attachment_names": attachment_names,
+        "source_hash": source_hash,
+        "location_timestamp": location_timestamp,
+    }
+
+    law_id = session.execute(select([laws.c.id]).where(laws.c.doknr == law_dict["doknr"])).scalar()
+    if law_id is None:
+        law_id = session.execute(laws.insert().values(law_row).returning(laws.c.id)).scalar()
+        stored_items = {}
+    else:
+        session.execute(laws.update().where(laws.c.id == law_id).values(law_row))
+        stored_items = _stored_content_items(session, law_id)
+
+    content_item_dicts = law_dict["contents"]
+    ids_by_doknr = {doknr: row.id for doknr, row in stored_items.items()}
+    new_doknrs = [item["doknr"] for item in content_item_dicts if item["doknr"] not in stored_items]
+    if new_doknrs:
+        ids_by_doknr.update(zip(new_doknrs, _reserve_ids(session, "content_items", len(new_doknrs))))
+
+    inserts = []
+    updates = []
+    for order, item in enumerate(content_item_dicts):
+        row = {
+            **{key: value for key, value in item.items() if key != "parent"},
+            "law_id": law_id,
+            "parent_id": item["parent"] and ids_by_doknr[item["parent"]["doknr"]],
+            "order": order,
+            "content_hash": content_item_hash(item),
+        }
+        stored = stored_items.get(item["doknr"])
+        if stored is None:
+            inserts.append({**row, "id": ids_by_doknr[item["doknr"]]})
+        elif (stored.content_hash, stored.parent_id, stored.order) != (row["content_hash"], row["parent_id"], order):
+            updates.append({**row, "_id": stored.id})
+
+    incoming_doknrs = {item["doknr"] for item in content_item_dicts}
+    deleted_ids = [row.id for doknr, row in stored_items.items() if doknr not in incoming_doknrs]
+
+    # Parents come before their children in `contents`, so inserting in order satisfies the parent foreign key.
+    # Items are re-parented before their old parents get deleted.
+    if inserts:
+        session.execute(content_items.insert(), inserts)
+    if updates:
+        session.execute(content_items.update().where(content_items.c.id == bindparam("_id")), updates)
+    if deleted_ids:
+        session.execute(content_items.delete().where(content_items.c.id.in_(deleted_ids)))
+
+    return law_id
@@ -1,27 +1,249 @@
-from email.utils import parsedate_to_datetime
+import contextlib
+import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+import functools
 import glob
-from io import BytesIO
+import hashlib
+import io
+import json
 import os
+import random
 import re
 import shutil
+import tempfile
+import threading
+import time
 from urllib.parse import urlparse
 import zipfile
 
-import boto3
-import botocore
 from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+
+from . import s3_transfer
 
 TOC_URL = "http://www.gesetze-im-internet.de/gii-toc.xml"
 
+DEFAULT_CONCURRENCY = 8
+DEFAULT_REQUESTS_PER_SECOND = 20
+
+
+class RateLimiter:
+    """Spaces out requests to each host so that no more than `requests_per_second` are started per host."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second
+        self._next_slot_by_host = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot_by_host.get(host, now))
+            self._next_slot_by_host[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ConcurrencyController:
+    """
+    Adaptive limit on the number of requests in flight (AIMD).
+
+    The limit grows by one for every `limit` requests that complete without sign of overload, up to
+    `max_concurrency`. It is halved when a request is overloaded: answered with 429 or 5xx, failed to connect, or
+    took more than `SLOW_LATENCY_FACTOR` times the lowest latency seen (and at least `SLOW_LATENCY_MIN` seconds).
+    Requests that started before the last decrease don't decrease it again, so that one burst of overload only
+    halves the limit once.
+    """
+
+    SLOW_LATENCY_FACTOR = 4
+    SLOW_LATENCY_MIN = 1.0
+
+    def __init__(self, max_concurrency, initial_concurrency=None):
+        self.max_concurrency = max_concurrency
+        self.limit = initial_concurrency or max(1, max_concurrency // 2)
+        self.peak_limit = self.limit
+        self.latencies = []
+        self._in_flight = 0
+        self._successes = 0
+        self._last_decrease = float("-inf")
+        self._min_latency = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot. Returns the start time to pass to `record`."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def is_slow(self, latency):
+        return self._min_latency is not None and latency > max(
+            self._min_latency * self.SLOW_LATENCY_FACTOR, self.SLOW_LATENCY_MIN
+        )
 
-def fetch_toc():
-    response = requests.get(TOC_URL)
-    response.raise_for_status()
+    def record(self, start, overloaded=False):
+        """Adjust the limit after a request that started at `start` got its response (or failed)."""
+        now = time.monotonic()
+        latency = now - start
+
+        with self._condition:
+            self.latencies.append(latency)
+            overloaded = overloaded or self.is_slow(latency)
+            if not overloaded:
+                self._min_latency = latency if self._min_latency is None else min(self._min_latency, latency)
+
+            if overloaded:
+                if start > self._last_decrease:
+                    self.limit = max(1, self.limit // 2)
+                    self._last_decrease = now
+                    self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self.peak_limit = max(self.peak_limit, self.limit)
+                    self._successes = 0
+                    self._condition.notify_all()
+
+    def latency_percentile(self, percentile):
+        with self._condition:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30
+
+
+def _release_on_close(response, release):
+    """Call `release` once, when the (streamed) response is closed."""
+    close = response.close
+    released = False
+
+    def close_and_release():
+        nonlocal released
+        try:
+            close()
+        finally:
+            if not released:
+                released = True
+                release()
+
+    response.close = close_and_release
+
+
+class Fetcher:
+    """
+    HTTP client for gesetze-im-internet.de that can be shared between threads.
+
+    Keeps up to `concurrency` keep-alive connections per host open and optionally rate limits requests per host. The
+    number of requests in flight adapts between 1 and `concurrency` (see `ConcurrencyController`), and idempotent
+    requests that fail with 429/5xx or a connection error are retried up to `max_retries` times with jittered
+    exponential backoff. Offers the `get`/`head` interface of the `requests` module.
+
+    For streamed responses, the request counts as in flight until the response is closed.
+    """
+
+    def __init__(
+        self, concurrency=DEFAULT_CONCURRENCY, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+        max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE
+    ):
+        self.concurrency = concurrency
+        self.rate_limiter = requests_per_second and RateLimiter(requests_per_second)
+        self.controller = ConcurrencyController(concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt, response):
+        retry_after = response is not None and response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), MAX_BACKOFF)
+        return random.uniform(0, min(self.backoff_base * 2 ** attempt, MAX_BACKOFF))
+
+    def _send(self, method, url, **kwargs):
+        if self.rate_limiter:
+            self.rate_limiter.wait(url)
+
+        start = self.controller.acquire()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.controller.record(start, overloaded=True)
+            self.controller.release()
+            raise
+
+        self.controller.record(start, overloaded=response.status_code in RETRY_STATUS_CODES)
+        if kwargs.get("stream"):
+            _release_on_close(response, self.controller.release)
+        else:
+            self.controller.release()
+        return response
+
+    def request(self, method, url, **kwargs):
+        retryable = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+
+        while True:
+            response = None
+            try:
+                response = self._send(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if not retryable or attempt >= self.max_retries:
+                    raise
+
+            if not retryable or attempt >= self.max_retries:
+                return response
+
+            if response is not None:
+                response.close()
+            with self._retries_lock:
+                self.retries += 1
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def summary(self):
+        p50, p95, p99 = (self.controller.latency_percentile(p) for p in (50, 95, 99))
+        latencies = "" if p50 is None else (
+            f", latency p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms"
+        )
+        return (
+            f"concurrency {self.controller.limit} (peak {self.controller.peak_limit}, max {self.concurrency}), "
+            f"{self.retries} retries{latencies}"
+        )
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
 
+
+def _parse_toc(content):
     toc = {}
 
-    doc = etree.fromstring(response.content)
+    doc = etree.fromstring(content)
     for item in doc.xpath("/items/item"):
         url = item.find("link").text
         slug = url.split("/")[-2]
@@ -30,87 +252,475 @@ def fetch_toc():
     return toc
 
 
-def _parse_last_modified_date_str(response):
-    last_modified_header = response.headers["Last-Modified"]
-    return parsedate_to_datetime(last_modified_header).strftime("%Y%m%d")
+def _toc_digest(toc):
+    return hashlib.sha256(json.dumps(toc, sort_keys=True).encode("utf-8")).hexdigest()
+
 
+def fetch_toc_incrementally(http=requests, toc_url=TOC_URL, previous_state=None):
+    """
+    Fetch the toc, conditionally on the validators in `previous_state` (as returned by an earlier call).
 
-def has_update(download_url, timestamp_string):
-    response = requests.head(download_url)
+    Returns the toc, the state to pass next time, and whether the toc changed: False if the server answered 304 or
+    the parsed slug -> URL map has the same digest as before.
+    """
+    if previous_state and previous_state["url"] != toc_url:
+        previous_state = None
+
+    response = http.get(toc_url, headers=_conditional_request_headers(previous_state and previous_state["validators"]))
+    if response.status_code == 304:
+        return previous_state["laws"], previous_state, False
     response.raise_for_status()
 
-    return _parse_last_modified_date_str(response) > timestamp_string
+    toc = _parse_toc(response.content)
+    state = {
+        "url": toc_url,
+        "validators": _validators_from_response(response),
+        "digest": _toc_digest(toc),
+        "laws": toc,
+    }
+    return toc, state, not previous_state or previous_state["digest"] != state["digest"]
+
+
+def _parse_last_modified_date_str(response):
+    last_modified_header = response.headers["Last-Modified"]
+    return parsedate_to_datetime(last_modified_header).strftime("%Y%m%d")
 
 
-def location_from_string(location_string):
+def _validators_from_response(response):
+    return {"last_modified": response.headers.get("Last-Modified"), "etag": response.headers.get("ETag")}
+
+
+def validators_from_timestamp(timestamp_string):
+    """
+    Validators for laws downloaded before full validators were stored: not modified since the end of the day of the
+    stored `%Y%m%d` timestamp, which matches the date comparison that was used before. None (i.e. an unconditional
+    request) if the timestamp can't be parsed, e.g. the "00000000" of laws that never had one.
+    """
+    try:
+        end_of_day = datetime.datetime.strptime(timestamp_string, "%Y%m%d")
+    except ValueError:
+        return None
+    end_of_day = end_of_day.replace(hour=23, minute=59, second=59, tzinfo=datetime.timezone.utc)
+    return {"last_modified": format_datetime(end_of_day, usegmt=True), "etag": None}
+
+
+def _conditional_request_headers(validators):
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def _fetch_law(download_url, http, validators):
+    """
+    GET a law's zip, conditionally if `validators` are given. Returns None if the law hasn't been modified, else the
+    response with its body not yet read.
+    """
+    response = http.get(download_url, headers=_conditional_request_headers(validators), stream=True)
+    if response.status_code == 304 or not response.ok:
+        # Free the connection (and the Fetcher's slot) right away.
+        response.close()
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    return response
+
+
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def spool_chunks(chunks, max_memory):
+    """
+    Write `chunks` of bytes to memory, moving them to a temp file on disk once there are more than `max_memory`
+    bytes. Returns the file, rewound.
+    """
+    # Not a SpooledTemporaryFile: before Python 3.11, zipfile can't read from one (it lacks `seekable`).
+    spooled = io.BytesIO()
+    for chunk in chunks:
+        if isinstance(spooled, io.BytesIO) and spooled.tell() + len(chunk) > max_memory:
+            on_disk = tempfile.TemporaryFile()
+            on_disk.write(spooled.getbuffer())
+            spooled = on_disk
+        spooled.write(chunk)
+
+    spooled.seek(0)
+    return spooled
+
+
+def _spool_response(response, max_memory):
+    """Stream a response body into memory, or into a temp file beyond `max_memory` bytes (see `spool_chunks`)."""
+    with contextlib.closing(response):
+        return spool_chunks(response.iter_content(_DOWNLOAD_CHUNK_SIZE), max_memory)
+
+
+def _content_hash(zip_archive):
+    """
+    SHA-256 over the names and contents of the files in an archive. Unlike a hash of the archive itself, it doesn't
+    change when the same files are merely re-packed.
+    """
+    hasher = hashlib.sha256()
+    for info in sorted(zip_archive.infolist(), key=lambda info: info.filename):
+        if info.is_dir():
+            continue
+        hasher.update(f"{info.filename}\0{info.file_size}\0".encode("utf-8"))
+        with zip_archive.open(info) as member:
+            for chunk in iter(lambda: member.read(_DOWNLOAD_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# Results of `create_or_replace_law`.
+DOWNLOADED = "downloaded"
+IDENTICAL = "identical"
+NOT_MODIFIED = "not_modified"
+
+# Name under which the downloaded archive is stored for locations that keep the original zip.
+ZIP_NAME = "xml.zip"
+# Index of all laws in a location, at the location's root.
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def location_from_string(location_string, store_zip=False):
+    """
+    Create a location from a local path or an S3 prefix url.
+
+    With `store_zip`, downloaded laws are stored as the original zip archive instead of being extracted. Reading
+    works with either layout, regardless of the flag.
+    """
     if location_string.startswith("s3://"):
-        return S3Location(location_string)
+        return S3Location(location_string, store_zip)
     else:
-        return LocalPathLocation(location_string)
+        return LocalPathLocation(location_string, store_zip)
+
+
+def _xml_member_name(zip_archive):
+    xml_names = [name for name in zip_archive.namelist() if name.endswith(".xml")]
+    assert len(xml_names) == 1, f"Expected 1 XML file in zip archive, got {len(xml_names)}"
+    return xml_names[0]
+
+
+def _attachment_member_names(zip_archive):
+    return [name for name in zip_archive.namelist() if not name.endswith((".xml", "/"))]
+
+
+class _ZipMemberFile(io.RawIOBase):
+    """A member of a zip archive that closes the archive's file object along with itself."""
+
+    def __init__(self, member, exit_stack):
+        super().__init__()
+        self._member = member
+        self._exit_stack = exit_stack
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._member.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            self._member.close()
+            self._exit_stack.close()
+        super().close()
+
+
+def _open_xml_in_zip(fileobj, xml_name=None):
+    """Open the XML member of a zip archive, given as a path or a file object. Closing it closes the archive, too."""
+    if not hasattr(fileobj, "read"):
+        # The member stays readable after the archive is closed, and ZipFile closes the file it opened with it.
+        with zipfile.ZipFile(fileobj) as zip_archive:
+            return zip_archive.open(xml_name or _xml_member_name(zip_archive))
+
+    # ZipFile never closes a file object it was handed, so the member has to.
+    with contextlib.ExitStack() as exit_stack:
+        exit_stack.callback(fileobj.close)
+        with zipfile.ZipFile(fileobj) as zip_archive:
+            member = zip_archive.open(xml_name or _xml_member_name(zip_archive))
+        return _ZipMemberFile(member, exit_stack.pop_all())
+
+
+def _attachment_names_in_zip(fileobj):
+    with contextlib.ExitStack() as exit_stack:
+        if hasattr(fileobj, "read"):
+            exit_stack.callback(fileobj.close)
+        with zipfile.ZipFile(fileobj) as zip_archive:
+            return _attachment_member_names(zip_archive)
+
+
+def _manifest_entry(response, zip_archive, store_zip):
+    """
+    Manifest entry for a freshly downloaded law.
+
+    `zip` is the name of the stored archive, or None if the law was extracted. `xml` and `attachments` are file
+    names within the law's directory, or member names within the archive. `hash` is the `_content_hash` of the
+    downloaded archive. `checked_at` is the (unix) time the law was last found to be up to date.
+    """
+    return {
+        "timestamp": _parse_last_modified_date_str(response),
+        "validators": _validators_from_response(response),
+        "hash": _content_hash(zip_archive),
+        "zip": ZIP_NAME if store_zip else None,
+        "xml": _xml_member_name(zip_archive),
+        "attachments": _attachment_member_names(zip_archive),
+        "checked_at": time.time(),
+    }
+
+
+class _Location:
+    """
+    Shared manifest handling for locations. The manifest maps each law's slug to its entry (see `_manifest_entry`) and
+    holds the last toc state, so that finding laws needs no directory scan or S3 listing. Locations without one are
+    scanned once to build it.
+    """
+
+    # Downloaded archives larger than this are spooled to disk rather than kept in memory.
+    DOWNLOAD_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+    def __init__(self, location_string, store_zip):
+        self.location_string = location_string
+        self.store_zip = store_zip
+        self._manifest_entries = None
+        self._toc_state = None
+        self._manifest_lock = threading.Lock()
+
+    def _manifest(self):
+        with self._manifest_lock:
+            if self._manifest_entries is None:
+                manifest = self._read_manifest()
+                if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+                    print(f"No manifest in {self.location_string}, scanning for laws")
+                    self._manifest_entries = self._scan_for_manifest_entries()
+                else:
+                    self._manifest_entries = manifest["laws"]
+                    self._toc_state = manifest.get("toc")
+            return self._manifest_entries
+
+    def _set_manifest_entry(self, slug, entry):
+        manifest = self._manifest()
+        with self._manifest_lock:
+            if entry is None:
+                manifest.pop(slug, None)
+            else:
+                manifest[slug] = entry
+
+    def _manifest_entry(self, slug):
+        entry = self._manifest().get(slug)
+        assert entry is not None, f"Law {slug} not found in {self.location_string}"
+        return entry
+
+    def _mark_checked(self, slug):
+        entry = self._manifest().get(slug)
+        if entry:
+            self._set_manifest_entry(slug, {**entry, "checked_at": time.time()})
+
+    def save_manifest(self):
+        """Atomically write the manifest, if it has been loaded."""
+        with self._manifest_lock:
+            if self._manifest_entries is None:
+                return
+            data = json.dumps(
+                {"version": MANIFEST_VERSION, "laws": self._manifest_entries, "toc": self._toc_state}, sort_keys=True
+            )
+        self._write_manifest(data.encode("utf-8"))
+
+    def toc_state(self):
+        """State of the last completed toc download, see `fetch_toc_incrementally`."""
+        self._manifest()
+        return self._toc_state
+
+    def set_toc_state(self, toc_state):
+        self._manifest()
+        with self._manifest_lock:
+            self._toc_state = toc_state
+
+    def checked_at(self, slug):
+        """Unix time of the law's last successful download or update check, or None."""
+        entry = self._manifest().get(slug)
+        return entry and entry.get("checked_at")
+
+    def create_or_replace_law(self, slug, download_url, http=requests, validators=None):
+        """
+        Download a law, replacing any previously downloaded version.
+
+        With `validators` from an earlier download, the download is conditional and the law is left alone if it
+        hasn't been modified since (NOT_MODIFIED). If it has been modified, but its files are identical to the stored
+        ones, only the new validators are kept (IDENTICAL). Otherwise, the law is stored (DOWNLOADED).
+        """
+        response = _fetch_law(download_url, http, validators)
+        if response is None:
+            self._mark_checked(slug)
+            return NOT_MODIFIED
+
+        archive_file = _spool_response(response, self.DOWNLOAD_SPOOL_MAX_MEMORY)
+        with archive_file, zipfile.ZipFile(archive_file) as zip_archive:
+            entry = _manifest_entry(response, zip_archive, self.store_zip)
+
+            previous_entry = self._manifest().get(slug)
+            if previous_entry and (previous_entry["hash"], previous_entry["zip"]) == (entry["hash"], entry["zip"]):
+                # Keep the previous timestamp, which consumers (e.g. ingest) take to mean the content changed.
+                self._set_manifest_entry(
+                    slug, {**previous_entry, "validators": entry["validators"], "checked_at": entry["checked_at"]}
+                )
+                return IDENTICAL
+
+            self.remove_law(slug)
+            self._store_law_files(slug, archive_file, zip_archive, entry["timestamp"])
+        self._set_manifest_entry(slug, entry)
+
+        return DOWNLOADED
 
+    def remove_law(self, slug):
+        self._remove_law_files(slug)
+        self._set_manifest_entry(slug, None)
 
-class LocalPathLocation:
-    def __init__(self, location_string):
-        self.data_dir = location_string
+    def validators_for(self, slug):
+        """Cache validators (Last-Modified, ETag) stored with the law's last download, or None."""
+        entry = self._manifest().get(slug)
+        return entry and entry["validators"]
 
-    def remove_law(self, slug):
-        shutil.rmtree(os.path.join(self.data_dir, slug), ignore_errors=True)
+    def list_slugs_with_timestamps(self):
+        return {slug: entry["timestamp"] for slug, entry in self._manifest().items()}
 
-    def create_or_replace_law(self, slug, download_url):
-        self.remove_law(slug)
+    def xml_file_for(self, slug):
+        """Path to the law's XML file or a binary file object for it, depending on the backend and layout."""
+        entry = self._manifest_entry(slug)
+        if entry["zip"]:
+            return _open_xml_in_zip(self._open_law_file(slug, entry["zip"], is_zip=True), entry["xml"])
+        return self._open_law_file(slug, entry["xml"])
 
-        dir_path = os.path.join(self.data_dir, slug)
-        os.makedirs(dir_path, exist_ok=True)
+    def attachment_names(self, slug):
+        entry = self._manifest_entry(slug)
+        if entry["attachments"] is None:
+            return _attachment_names_in_zip(self._open_law_file(slug, entry["zip"], is_zip=True))
+        return entry["attachments"]
 
-        response = requests.get(download_url)
-        response.raise_for_status()
 
-        zip_archive = zipfile.ZipFile(BytesIO(response.content))
-        zip_archive.extractall(dir_path)
+class LocalPathLocation(_Location):
+    def __init__(self, location_string, store_zip=False):
+        super().__init__(location_string, store_zip)
+        self.data_dir = location_string
 
-        timestamp = _parse_last_modified_date_str(response)
-        with open(dir_path + "/.timestamp", "w") as f:
-            f.write(timestamp)
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.data_dir, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
 
-    def list_slugs_with_timestamps(self):
-        result = {}
+    def _write_manifest(self, data):
+        os.makedirs(self.data_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.data_dir, MANIFEST_NAME))
+
+    def _scan_for_manifest_entries(self):
+        entries = {}
 
         for path in glob.glob(f"{self.data_dir}/*/"):
             slug = path.split("/")[-2]
             try:
                 with open(path + ".timestamp") as f:
-                    result[slug] = f.read()
+                    timestamp = f.read()
             except FileNotFoundError:
                 print(f"Warning: No .timestamp in {path}")
-                result[slug] = "00000000"
+                timestamp = "00000000"
+
+            entry = {"timestamp": timestamp, "validators": None, "hash": None}
+            if os.path.exists(path + ZIP_NAME):
+                entry.update(zip=ZIP_NAME, xml=None, attachments=None)
+            else:
+                xml_files = glob.glob(f"{path}*.xml")
+                assert len(xml_files) == 1, f"Expected 1 XML file in {path}, got {len(xml_files)}"
+                entry.update(
+                    zip=None,
+                    xml=os.path.basename(xml_files[0]),
+                    attachments=[os.path.basename(f) for f in glob.glob(f"{path}*") if not f.endswith(".xml")],
+                )
+            entries[slug] = entry
+
+        return entries
+
+    def _remove_law_files(self, slug):
+        shutil.rmtree(os.path.join(self.data_dir, slug), ignore_errors=True)
 
-        return result
+    def _store_law_files(self, slug, archive_file, zip_archive, timestamp):
+        dir_path = os.path.join(self.data_dir, slug)
+        os.makedirs(dir_path, exist_ok=True)
 
-    def xml_file_for(self, slug):
-        law_dir = os.path.join(self.data_dir, slug)
-        xml_files = glob.glob(f"{law_dir}/*.xml")
-        assert len(xml_files) == 1, f"Expected 1 XML file in {law_dir}, got {len(xml_files)}"
+        if self.store_zip:
+            archive_file.seek(0)
+            with open(os.path.join(dir_path, ZIP_NAME), "wb") as f:
+                shutil.copyfileobj(archive_file, f)
+        else:
+            zip_archive.extractall(dir_path)
 
-        return xml_files[0]
+        # Kept so that the manifest can be rebuilt by scanning.
+        with open(dir_path + "/.timestamp", "w") as f:
+            f.write(timestamp)
 
-    def attachment_names(self, slug):
-        law_dir = os.path.join(self.data_dir, slug)
-        all_files = glob.glob(f"{law_dir}/*")
-        attachments = [os.path.basename(path) for path in all_files if not path.endswith(".xml")]
-        return attachments
-
-
-class S3Location:
-    def __init__(self, location_string):
-        # Cf. https://stackoverflow.com/a/44478894/11819
-        # "With boto3, the S3 urls are virtual by default, which then require internet access to be
-        # resolved to region specific urls. This causes the hanging of the Lambda function until
-        # timeout."
-        self.s3 = boto3.client(
-            "s3",
-            "eu-central-1",
-            config=botocore.config.Config(s3={"addressing_style": "path"}),
-        )
+    def _open_law_file(self, slug, name, is_zip=False):
+        # Local files are read by path.
+        return os.path.join(self.data_dir, slug, name)
+
+
+class _S3RangeReader(io.RawIOBase):
+    """
+    Seekable, read-only file object for an S3 object, backed by ranged GET requests.
+
+    Lets `zipfile` read the central directory and a single member of an archive stored on S3 without downloading
+    the whole archive. Wrap in `io.BufferedReader` to avoid one request per small read.
+    """
+
+    def __init__(self, s3, bucket, key):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size or len(buffer) == 0:
+            return 0
+
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.s3.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={self.position}-{end}")
+        data = response["Body"].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class S3Location(_Location):
+    # Buffer size for reads from stored zip archives. Every buffer fill is one ranged GET request.
+    ZIP_READ_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, location_string, store_zip=False):
+        super().__init__(location_string, store_zip)
+        self.s3 = s3_transfer.get_client()
 
         parsed_url = urlparse(location_string)
         self.bucket = parsed_url.netloc
@@ -134,71 +744,74 @@ class S3Location:
         )
         return self._unpack_pagination(paginator, "Contents", "Key")
 
-    def _upload_file(self, slug, name, body):
+    def _upload_files(self, slug, files):
+        """Upload (name, body) pairs into the law's prefix, concurrently."""
         prefix = self._law_prefix(slug)
-        self.s3.put_object(Bucket=self.bucket, Key=f"{prefix}{name}", Body=body)
-
-    def _fetch_file(self, key):
-        buf = BytesIO()
-        self.s3.download_fileobj(self.bucket, key, buf)
-        buf.seek(0)
-        return buf
-
-    def remove_law(self, slug):
-        prefix = self._law_prefix(slug)
-        keys = self._list_keys(prefix)
-        if keys:
-            # NB: `delete_objects` has a limit of 1000 keys, but we are not likely to run into that here.
-            self.s3.delete_objects(
-                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in keys]}
-            )
-
-    def create_or_replace_law(self, slug, download_url):
-        self.remove_law(slug)
-
-        response = requests.get(download_url)
-        response.raise_for_status()
-
-        zip_archive = zipfile.ZipFile(BytesIO(response.content))
-        for filename in zip_archive.namelist():
-            content_bytes = zip_archive.read(filename)
-            self._upload_file(slug, filename, content_bytes)
-
-        timestamp = _parse_last_modified_date_str(response)
-        self._upload_file(slug, f".last_modified_{timestamp}", "")
-
-    def list_slugs_with_timestamps(self):
-        slugs = set()
-        slugs_with_timestamps = {}
-
-        all_keys = self._list_keys(self.key_prefix)
-
-        for key in all_keys:
-            split = key.split("/")
-            slug = split[2]
-            filename = split[3]
-            slugs.add(slug)
-            if re.match(r"\.last_modified_\d{8}", filename):
-                slugs_with_timestamps[slug] = filename[-8:]
-
-        for slug in slugs:
-            if slug not in slugs_with_timestamps:
+        s3_transfer.put_objects(self.bucket, ((f"{prefix}{name}", body) for name, body in files))
+
+    def _open_file(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def _open_zip_file(self, key):
+        return io.BufferedReader(_S3RangeReader(self.s3, self.bucket, key), self.ZIP_READ_BUFFER_SIZE)
+
+    def _open_law_file(self, slug, name, is_zip=False):
+        key = self._law_prefix(slug) + name
+        return self._open_zip_file(key) if is_zip else self._open_file(key)
+
+    def _read_manifest(self):
+        try:
+            return json.load(self._open_file(self.key_prefix + MANIFEST_NAME))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def _write_manifest(self, data):
+        # A single PUT replaces the object atomically.
+        self.s3.put_object(Bucket=self.bucket, Key=self.key_prefix + MANIFEST_NAME, Body=data)
+
+    def _scan_for_manifest_entries(self):
+        keys_by_slug = {}
+        for key in self._list_keys(self.key_prefix):
+            path = key[len(self.key_prefix):]
+            if "/" not in path:
+                continue  # e.g. the manifest itself
+            slug, filename = path.split("/", 1)
+            keys_by_slug.setdefault(slug, []).append(filename)
+
+        entries = {}
+        for slug, filenames in keys_by_slug.items():
+            timestamps = [name[-8:] for name in filenames if re.match(r"\.last_modified_\d{8}", name)]
+            if not timestamps:
                 print(f"Warning: No timestamp for {slug}")
-                slugs_with_timestamps[slug] = "00000000"
-
-        return slugs_with_timestamps
 
-    def xml_file_for(self, slug):
-        all_files = self._list_keys(self._law_prefix(slug))
-        xml_files = [f for f in all_files if f.endswith(".xml")]
-        assert len(xml_files) == 1, f"Expected 1 XML file for {slug}, got {len(xml_files)}"
-
-        return self._fetch_file(xml_files[0])
-
-    def attachment_names(self, slug):
-        all_files = self._list_keys(self._law_prefix(slug))
-        attachments = [
-            os.path.basename(key) for key in all_files
-            if not os.path.basename(key).startswith(".") and not key.endswith(".xml")
-        ]
-        return attachments
+            entry = {"timestamp": timestamps[0] if timestamps else "00000000", "validators": None, "hash": None}
+            if ZIP_NAME in filenames:
+                entry.update(zip=ZIP_NAME, xml=None, attachments=None)
+            else:
+                xml_files = [name for name in filenames if name.endswith(".xml")]
+                assert len(xml_files) == 1, f"Expected 1 XML file for {slug}, got {len(xml_files)}"
+                entry.update(
+                    zip=None,
+                    xml=xml_files[0],
+                    attachments=[name for name in filenames if not name.startswith(".") and not name.endswith(".xml")],
+                )
+            entries[slug] = entry
+
+        return entries
+
+    def _remove_law_files(self, slug):
+        s3_transfer.delete_keys(self.bucket, self._list_keys(self._law_prefix(slug)))
+
+    def _store_law_files(self, slug, archive_file, zip_archive, timestamp):
+        if self.store_zip:
+            archive_file.seek(0)
+            s3_transfer.upload_fileobj(archive_file, self.bucket, self._law_prefix(slug) + ZIP_NAME)
+            files = []
+        else:
+            # Members are read in the upload threads, so only the ones currently being uploaded are in memory.
+            files = [
+                (filename, functools.partial(zip_archive.read, filename)) for filename in zip_archive.namelist()
+            ]
+
+        # The marker is kept so that the manifest can be rebuilt by scanning.
+        self._upload_files(slug, files + [(f".last_modified_{timestamp}", b"")])
@@ -0,0 +1,95 @@
+import gzip
+import json
+import os
+import tempfile
+
+
+def _serialize(law_dict):
+    # Content items reference their parent item dict. Store the parent's doknr instead, and restore the reference
+    # on load.
+    contents = [{**item, "parent": item["parent"] and item["parent"]["doknr"]} for item in law_dict["contents"]]
+    data = json.dumps({**law_dict, "contents": contents}, ensure_ascii=False, separators=(",", ":"))
+    return gzip.compress(data.encode("utf-8"))
+
+
+def _deserialize(data):
+    law_dict = json.loads(gzip.decompress(data).decode("utf-8"))
+
+    items_by_doknr = {}
+    for item in law_dict["contents"]:
+        item["parent"] = item["parent"] and items_by_doknr[item["parent"]]
+        items_by_doknr[item["doknr"]] = item
+
+    return law_dict
+
+
+class ParseCache:
+    """
+    On-disk cache of `parse_law` results, keyed by the SHA-256 of the law's XML.
+
+    When the cache grows beyond `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Mark entry as recently used.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return _deserialize(data)
+
+    def put(self, key, law_dict):
+        # Write to a temp file and rename, so concurrent readers (e.g. other ingest workers) never see partial files.
+        data = _serialize(law_dict)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        self._total_bytes += len(data)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json.gz"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        # Re-scan instead of trusting the running total, other processes may share the cache directory.
+        entries = self._entries()
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+        self._total_bytes = total_bytes
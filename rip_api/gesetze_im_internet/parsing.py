@@ -1,5 +1,3 @@
-import itertools
-
 from lxml import etree
 
 from .utils import chunk_string
@@ -8,9 +6,16 @@ from .utils import chunk_string
 def _text(elements, multi=False):
     def _element_text_with_tags(element):
         """Preserve XML tags in the returned text string."""
-        return "".join(
-            itertools.chain([element.text or ""], (etree.tostring(child, encoding="unicode") for child in element))
-        ).strip()
+        text = element.text or ""
+        if len(element) == 0:
+            return text.strip()
+
+        # Serialize the element once and cut out its children (with their tails), instead of serializing every child
+        # separately. The element's own leading text is used unescaped, as `element.text` returns it.
+        serialized = etree.tostring(element, encoding="unicode", with_tail=False)
+        children_start = serialized.index("<", serialized.index(">") + 1)
+        children_end = serialized.rindex("</")
+        return (text + serialized[children_start:children_end]).strip()
 
     if elements is None or len(elements) == 0:
         return None
@@ -24,8 +29,33 @@ def _text(elements, multi=False):
     return values[0].strip() or None
 
 
+# XPath expressions are compiled once at import time instead of on every call.
+_AMTABK = etree.XPath("metadaten/amtabk")
+_JURABK = etree.XPath("metadaten/jurabk")
+_AUSFERTIGUNG_DATUM = etree.XPath("metadaten/ausfertigung-datum")
+_LANGUE = etree.XPath("metadaten/langue")
+_KURZUE = etree.XPath("metadaten/kurzue")
+_FUNDSTELLE = etree.XPath("metadaten/fundstelle")
+_STANDANGABE = etree.XPath("metadaten/standangabe")
+_GLIEDERUNGSEINHEIT = etree.XPath("metadaten/gliederungseinheit")
+_ENBEZ = etree.XPath("metadaten/enbez")
+_TITEL = etree.XPath("metadaten/titel")
+_TEXT = etree.XPath("textdaten/text")
+_FUSSNOTEN_CONTENT = etree.XPath("textdaten/fussnoten/Content")
+_PERIODIKUM = etree.XPath("periodikum")
+_ZITSTELLE = etree.XPath("zitstelle")
+_STANDTYP = etree.XPath("standtyp")
+_STANDKOMMENTAR = etree.XPath("standkommentar")
+_GLIEDERUNGSKENNZAHL = etree.XPath("metadaten/gliederungseinheit/gliederungskennzahl")
+_GLIEDERUNGSBEZ = etree.XPath("metadaten/gliederungseinheit/gliederungsbez")
+_GLIEDERUNGSTITEL = etree.XPath("metadaten/gliederungseinheit/gliederungstitel")
+_CONTENT = etree.XPath("Content")
+_TOC = etree.XPath("TOC")
+_FOOTNOTES = etree.XPath("Footnotes")
+
+
 def _parse_abbrs(norm):
-    abbrs = (_text(norm.xpath("metadaten/amtabk"), multi=True) or []) + _text(norm.xpath("metadaten/jurabk"), multi=True)
+    abbrs = (_text(_AMTABK(norm), multi=True) or []) + _text(_JURABK(norm), multi=True)
     abbrs_unique = list(dict.fromkeys(abbrs))
     primary, *rest = abbrs_unique
 
@@ -33,42 +63,42 @@ def _parse_abbrs(norm):
 
 
 def _parse_publication_info(norm):
-    elements = norm.xpath("metadaten/fundstelle")
+    elements = _FUNDSTELLE(norm)
     if not elements:
         return []
     return [
         {
-            "periodical": _text(el.xpath("periodikum")),
-            "reference": _text(el.xpath("zitstelle"))
+            "periodical": _text(_PERIODIKUM(el)),
+            "reference": _text(_ZITSTELLE(el))
         } for el in elements
     ]
 
 
 def _parse_status_info(norm):
-    elements = norm.xpath("metadaten/standangabe")
+    elements = _STANDANGABE(norm)
     if not elements:
         return []
     return [
         {
-            "category": _text(el.xpath("standtyp")),
-            "comment": _text(el.xpath("standkommentar"))
+            "category": _text(_STANDTYP(el)),
+            "comment": _text(_STANDKOMMENTAR(el))
         } for el in elements
     ]
 
 
 def _parse_section_info(norm):
-    if not norm.xpath("metadaten/gliederungseinheit"):
+    if not _GLIEDERUNGSEINHEIT(norm):
         return None
 
     return {
-        "code": _text(norm.xpath("metadaten/gliederungseinheit/gliederungskennzahl")),
-        "name": _text(norm.xpath("metadaten/gliederungseinheit/gliederungsbez")),
-        "title": _text(norm.xpath("metadaten/gliederungseinheit/gliederungstitel"))
+        "code": _text(_GLIEDERUNGSKENNZAHL(norm)),
+        "name": _text(_GLIEDERUNGSBEZ(norm)),
+        "title": _text(_GLIEDERUNGSTITEL(norm))
     }
 
 
 def _parse_text(norm):
-    elements = norm.xpath("textdaten/text")
+    elements = _TEXT(norm)
 
     if not elements:
         return {}
@@ -83,11 +113,11 @@ def _parse_text(norm):
 
     assert text_format == "XML", f'Unknown text format {text["format"]}'
 
-    content = _parse_text_content(text.xpath("Content"))
-    toc = _text(text.xpath("TOC"))
+    content = _parse_text_content(_CONTENT(text))
+    toc = _text(_TOC(text))
     assert not (content and toc), "Found norm with both TOC and Content."
 
-    data = {"body": content or toc, "footnotes": _text(text.xpath("Footnotes"))}
+    data = {"body": content or toc, "footnotes": _text(_FOOTNOTES(text))}
 
     return data
 
@@ -103,7 +133,7 @@ EMPTY_CONTENT_PATTERNS = ["<P/>", "<P>-</P>"]
 
 
 def _parse_documentary_footnotes(norm):
-    return _parse_text_content(norm.xpath("textdaten/fussnoten/Content"))
+    return _parse_text_content(_FUSSNOTEN_CONTENT(norm))
 
 
 def load_norms_from_file(file_or_filepath):
@@ -116,16 +146,42 @@ def load_norms_from_file(file_or_filepath):
     return doc.xpath("/dokumente/norm")
 
 
+def iter_norms_from_file(file_or_filepath):
+    """
+    Yield `/dokumente/norm` elements one at a time, discarding each norm (and any preceding siblings) once the
+    caller asks for the next one. Keeps memory use bounded by the size of a single norm.
+    """
+    if hasattr(file_or_filepath, "read"):
+        yield from _iterparse_norms(file_or_filepath)
+    else:
+        with open(file_or_filepath, "rb") as f:
+            yield from _iterparse_norms(f)
+
+
+def _iterparse_norms(f):
+    for _, norm in etree.iterparse(f, events=("end",), tag="norm"):
+        parent = norm.getparent()
+        if parent is None or parent.getparent() is not None:
+            # Only top-level norms are of interest.
+            continue
+
+        yield norm
+
+        norm.clear(keep_tail=True)
+        while norm.getprevious() is not None:
+            del parent[0]
+
+
 def extract_law_attrs(header_norm):
     abbrs = _parse_abbrs(header_norm)
     notes_text = _parse_text(header_norm)
     return {
         "doknr": header_norm.get("doknr"),
         **abbrs,
-        "first_published": _text(header_norm.xpath("metadaten/ausfertigung-datum")),
+        "first_published": _text(_AUSFERTIGUNG_DATUM(header_norm)),
         "source_timestamp": header_norm.get("builddate"),
-        "title_long": _text(header_norm.xpath("metadaten/langue")),
-        "title_short": _text(header_norm.xpath("metadaten/kurzue")),
+        "title_long": _text(_LANGUE(header_norm)),
+        "title_short": _text(_KURZUE(header_norm)),
         "publication_info": _parse_publication_info(header_norm),
         "status_info": _parse_status_info(header_norm),
         "notes_body": notes_text.get("body"),
@@ -155,13 +211,11 @@ def extract_contents(body_norms):
         else:
             raise Exception(f"Unknown norm structure encountered: {etree.tostring(norm)}")
 
-    def _set_name_and_title(item, norm):
-        section_info = _parse_section_info(norm)
-
+    def _set_name_and_title(item, norm, section_info):
         if "NE" in item["doknr"]:
             item.update({
-                "name": _text(norm.xpath("metadaten/enbez")),
-                "title": _text(norm.xpath("metadaten/titel"))
+                "name": _text(_ENBEZ(norm)),
+                "title": _text(_TITEL(norm))
             })
         elif "NG" in item["doknr"]:
             item.update({
@@ -183,8 +237,7 @@ def extract_contents(body_norms):
                 return sections_by_code[substring]
         return None
 
-    def _set_parent(item, norm, parser_state):
-        section_info = _parse_section_info(norm)
+    def _set_parent(item, section_info, parser_state):
         code = section_info and section_info["code"]
 
         if "NE" in item["doknr"]:
@@ -209,10 +262,12 @@ def extract_contents(body_norms):
     }
 
     for norm in body_norms:
+        # Section info feeds both name/title and parent lookup, so only parse it once per norm.
+        section_info = _parse_section_info(norm)
         item = _extract_common_attrs(norm)
         _set_item_type(item, norm)
-        _set_name_and_title(item, norm)
-        _set_parent(item, norm, parser_state)
+        _set_name_and_title(item, norm, section_info)
+        _set_parent(item, section_info, parser_state)
         content_items.append(item)
 
     # Convert empty heading articles to articles
@@ -223,10 +278,20 @@ def extract_contents(body_norms):
     return content_items
 
 
-def parse_law(file_or_filepath):
-    header_norm, *body_norms = load_norms_from_file(file_or_filepath)
+def parse_law(file_or_filepath, streaming=False):
+    """
+    Parse a law XML file into a dict.
+
+    With `streaming=True`, norms are parsed incrementally and discarded after use instead of loading the whole
+    document tree first. Streaming requires a file path or a binary file object.
+    """
+    if streaming:
+        norms = iter_norms_from_file(file_or_filepath)
+    else:
+        norms = iter(load_norms_from_file(file_or_filepath))
 
+    header_norm = next(norms)
     law_attrs = extract_law_attrs(header_norm)
-    law_attrs["contents"] = extract_contents(body_norms)
+    law_attrs["contents"] = extract_contents(norms)
 
     return law_attrs
@@ -0,0 +1,103 @@
+"""
+Shared S3 access: one client per process, a thread pool for concurrent PUTs, multipart uploads for large files and
+deletes batched to the API limit of 1,000 keys per request.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+import botocore
+
+REGION = "eu-central-1"
+
+PUT_CONCURRENCY = 16
+DELETE_BATCH_SIZE = 1000
+
+# Files larger than the threshold (e.g. the bulk law tarballs) are uploaded in parts, several parts at a time.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=PUT_CONCURRENCY,
+)
+
+_lock = threading.Lock()
+_client = None
+_executor = None
+_pid = None
+
+
+def _shared():
+    global _client, _executor, _pid
+
+    with _lock:
+        # Neither clients nor thread pools survive a fork, so each process builds its own.
+        if _pid != os.getpid():
+            # Cf. https://stackoverflow.com/a/44478894/11819
+            # "With boto3, the S3 urls are virtual by default, which then require internet access to be
+            # resolved to region specific urls. This causes the hanging of the Lambda function until
+            # timeout."
+            _client = boto3.client(
+                "s3",
+                REGION,
+                config=botocore.config.Config(
+                    s3={"addressing_style": "path"},
+                    # Leave room for the PUT pool next to callers that use the client from their own threads.
+                    max_pool_connections=PUT_CONCURRENCY * 2,
+                ),
+            )
+            _executor = ThreadPoolExecutor(max_workers=PUT_CONCURRENCY, thread_name_prefix="s3-put")
+            _pid = os.getpid()
+
+        return _client, _executor
+
+
+def get_client():
+    """The process-wide S3 client. boto3 clients can be shared between threads."""
+    return _shared()[0]
+
+
+def _put_object(client, bucket, key, body):
+    if callable(body):
+        body = body()
+    client.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def put_objects(bucket, objects):
+    """
+    PUT (key, body) pairs concurrently. A body can also be a function returning it, which is called in the upload
+    thread, so that bodies are only held in memory while they are being uploaded.
+
+    Waits for all uploads to finish, then raises the first error, if any.
+    """
+    client, executor = _shared()
+    futures = [executor.submit(_put_object, client, bucket, key, body) for key, body in objects]
+    wait(futures)
+    for future in futures:
+        future.result()
+
+
+def delete_keys(bucket, keys):
+    """Delete any number of keys, in batches of `DELETE_BATCH_SIZE`."""
+    client = get_client()
+    keys = list(keys)
+
+    for i in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[i:i + DELETE_BATCH_SIZE]
+        response = client.delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+        )
+        errors = response.get("Errors")
+        if errors:
+            raise Exception(f"Failed to delete {len(errors)} S3 objects, e.g. {errors[0]}")
+
+
+def upload_file(local_path, bucket, key):
+    """Upload a local file, in parallel parts if it's large."""
+    get_client().upload_file(local_path, bucket, key, Config=TRANSFER_CONFIG)
+
+
+def upload_fileobj(fileobj, bucket, key):
+    """Upload a binary file object, in parallel parts if it's large."""
+    get_client().upload_fileobj(fileobj, bucket, key, Config=TRANSFER_CONFIG)
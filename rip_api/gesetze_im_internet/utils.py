@@ -1,4 +1,6 @@
 import itertools
+import resource
+import sys
 
 
 # From: https://docs.python.org/3/library/itertools.html?highlight=itertools#itertools-recipes
@@ -11,3 +13,23 @@ def grouper(iterable, n, fillvalue=None):
 
 def chunk_string(string, length):
     return ["".join(chunk) for chunk in grouper(string, length)]
+
+
+def rss_mb(peak=False):
+    """
+    Current (or with `peak`, peak) resident set size of this process in MB. Falls back to the peak RSS where
+    /proc isn't available.
+    """
+    # On Linux, ru_maxrss is carried over from the parent process across fork+exec, so prefer /proc.
+    field = "VmHWM:" if peak else "VmRSS:"
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
@@ -1,3 +1,5 @@
+import json
+
 import boto3
 from mangum import Mangum
 
@@ -7,16 +9,36 @@ from .api import app
 api = Mangum(app)
 
 DATA_LOCATION = f"s3://{ASSET_BUCKET}/public/gesetze_im_internet"
+INGEST_BATCH_SIZE = 50
+INGEST_FUNCTION_NAME = "fellows-2020-rechtsinfo-IngestLaws"
+
+
+def _invoke_async(function_name, payload=None):
+    boto3.client("lambda").invoke(
+        FunctionName=function_name, InvocationType="Event", Payload=json.dumps(payload or {})
+    )
 
 
 def download_laws(event, context):
     location = gesetze_im_internet.download.location_from_string(DATA_LOCATION)
-    gesetze_im_internet.download_laws(location)
-    boto3.client("lambda").invoke(FunctionName="fellows-2020-rechtsinfo-IngestLaws", InvocationType="Event")
+    stats = gesetze_im_internet.download_laws(location)
+    if not stats["downloaded"] and not stats["removed"]:
+        print("No laws changed, not triggering ingest")
+        return
+    _invoke_async(INGEST_FUNCTION_NAME)
 
 
 def ingest_laws(event, context):
+    """
+    Start an ingest run, or continue the one in `event["run_id"]`. Runs that don't finish within this invocation's
+    time limit are continued by invoking this function again.
+    """
+    location = gesetze_im_internet.download.location_from_string(DATA_LOCATION)
     with db.session_scope() as session:
-        location = gesetze_im_internet.download.location_from_string(DATA_LOCATION)
-        gesetze_im_internet.ingest_data_from_location(session, location)
-        gesetze_im_internet.generate_and_upload_bulk_law_files(session)
+        run_id = (event or {}).get("run_id") or gesetze_im_internet.start_ingest_run(session, location)
+        gesetze_im_internet.continue_ingest_run(
+            session, location, run_id,
+            time_remaining=lambda: context.get_remaining_time_in_millis() / 1000,
+            invoke=lambda payload: _invoke_async(context.function_name, payload),
+            batch_size=INGEST_BATCH_SIZE,
+        )
@@ -1,6 +1,8 @@
+import hashlib
+import json
 import re
 
-from sqlalchemy import Column, Computed, ForeignKey, Index, Integer, String
+from sqlalchemy import Column, Computed, DateTime, ForeignKey, Index, Integer, String, func
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -20,6 +22,12 @@ def slugify(string):
     return string
 
 
+def content_item_hash(content_item_dict):
+    """SHA-256 of a parsed content item's own fields, i.e. not its parent or position."""
+    fields = {k: v for k, v in content_item_dict.items() if k != "parent"}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
 class Law(Base):
     __tablename__ = "laws"
 
@@ -39,6 +47,11 @@ class Law(Base):
     notes_footnotes = Column(String)
     notes_documentary_footnotes = Column(String)
     attachment_names = Column(postgresql.ARRAY(String), nullable=False)
+    # SHA-256 of the XML the law was ingested from. Lets ingest skip laws whose XML hasn't changed.
+    source_hash = Column(String)
+    # The law's timestamp in the location (i.e. its download date) when it was last ingested. Ingest compares it to
+    # the location's to find updated laws.
+    location_timestamp = Column(String)
     # Search index. Cf. https://www.postgresql.org/docs/current/textsearch-controls.html
     search_tsv = Column(postgresql.TSVECTOR, Computed("""
         setweight(to_tsvector('german',
@@ -59,8 +72,8 @@ class Law(Base):
         passive_deletes=True
     )
 
-    __table_args = (
-        Index('ix_laws_search_tsv', search_tsv, postgresql_using='gin')
+    __table_args__ = (
+        Index('ix_laws_search_tsv', search_tsv, postgresql_using='gin'),
     )
 
     @staticmethod
@@ -95,6 +108,8 @@ class ContentItem(Base):
     law_id = Column(Integer, ForeignKey("laws.id", ondelete="CASCADE"), index=True)
     parent_id = Column(Integer, ForeignKey("content_items.id"))
     order = Column(Integer, nullable=False)
+    # See content_item_hash(). Lets ingest only write the content items of a law that changed.
+    content_hash = Column(String)
     # Search index. Cf. https://www.postgresql.org/docs/current/textsearch-controls.html
     search_tsv = Column(postgresql.TSVECTOR, Computed("""
         setweight(to_tsvector('german',
@@ -109,8 +124,8 @@ class ContentItem(Base):
     law = relationship("Law", back_populates="contents")
     parent = relationship("ContentItem", remote_side=[id], uselist=False)
 
-    __table_args = (
-        Index('ix_content_items_search_tsv', search_tsv, postgresql_using='gin')
+    __table_args__ = (
+        Index('ix_content_items_search_tsv', search_tsv, postgresql_using='gin'),
     )
 
     @staticmethod
@@ -119,5 +134,22 @@ class ContentItem(Base):
         parent = parent_dict and content_items_by_doknr[parent_dict["doknr"]]
 
         content_item_attrs = {k: v for k, v in content_item_dict.items() if k != "parent"}
-        content_item = ContentItem(parent=parent, order=order, **content_item_attrs)
+        content_item = ContentItem(
+            parent=parent, order=order, content_hash=content_item_hash(content_item_dict), **content_item_attrs
+        )
         return content_item
+
+
+class IngestRun(Base):
+    """Journal of an ingest that is split across several invocations, see `gesetze_im_internet.continue_ingest_run`."""
+    __tablename__ = "ingest_runs"
+
+    id = Column(Integer, primary_key=True)
+    phase = Column(String, nullable=False)
+    # Laws still to be stored, in the order they'll be processed.
+    pending_slugs = Column(postgresql.ARRAY(String), nullable=False)
+    # Laws to delete once all pending laws are stored.
+    removed_slugs = Column(postgresql.ARRAY(String), nullable=False)
+    stats = Column(postgresql.JSONB, nullable=False)
+    started_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
@@ -6,6 +6,7 @@ import uvicorn
 
 from rip_api import ASSET_BUCKET, db, gesetze_im_internet
 from rip_api.gesetze_im_internet.download import location_from_string
+from rip_api.gesetze_im_internet.parse_cache import ParseCache
 
 ns = Collection()
 
@@ -51,31 +52,159 @@ def run_tests(c):
 ns.add_task(run_tests, 'tests')
 
 
+# Benchmarks
+
+@task(
+    help={
+        "repeat": "Take the best of this many runs per law"
+    }
+)
+def bench_parser(c, repeat=5):
+    """Measure parser throughput (norms/second) on the XML test fixtures."""
+    from benchmarks import parsing as parsing_benchmark
+    parsing_benchmark.run(repeat)
+
+
+@task(
+    help={
+        "output": "Write results to this JSON file",
+        "compare-to": "Flag regressions against this earlier results file",
+        "scales": "Comma-separated factors to enlarge each law by (default: 1,10,100)",
+        "repeat": "Take the best of this many runs per case"
+    }
+)
+def bench_parser_suite(c, output=None, compare_to=None, scales="1,10,100", repeat=3):
+    """Measure parser throughput and peak memory on the XML test fixtures and enlarged copies of them."""
+    from benchmarks import parsing as parsing_benchmark
+    _, regressions = parsing_benchmark.run_suite(
+        output, compare_to, [int(scale) for scale in scales.split(",")], repeat
+    )
+    if regressions:
+        exit(1)
+
+
+@task(
+    help={
+        "law": "Fixture law to enlarge (default: estg)",
+        "scale": "Factor to enlarge the law by (default: 10, roughly BGB-sized)"
+    }
+)
+def bench_serialization(c, law="estg", scale=10):
+    """Compare norm text serialization against the previous per-child implementation."""
+    from benchmarks import serialization as serialization_benchmark
+    serialization_benchmark.run(law, scale)
+
+
+@task(
+    help={
+        "backends": "Comma-separated location backends (default: local,s3)",
+        "copies": "Serve each fixture law under this many slugs (default: 20)",
+        "latency": "Seconds to delay each mirror response by (default: 0.05)",
+        "bandwidth": "Bytes/second to send each response body at (default: unlimited)",
+        "concurrency": "Number of parallel requests (default: 8)",
+        "churn": "Fraction of laws to bump before the warm run (default: 0.1)",
+        "store-zip": "Store laws as zip archives"
+    }
+)
+def bench_download(
+    c, backends="local,s3", copies=20, latency=0.05, bandwidth=None, concurrency=8, churn=0.1, store_zip=False
+):
+    """Measure download_laws against a local gesetze-im-internet.de mirror."""
+    # Imported here rather than at the top, as it pulls in the mirror from the test package.
+    from benchmarks import download as download_benchmark
+    download_benchmark.run(
+        backends.split(","), copies, latency, bandwidth and int(bandwidth), concurrency, churn=churn,
+        store_zip=store_zip
+    )
+
+
+@task(
+    help={
+        "shards": "Comma-separated numbers of shards to run with (default: 1,2,4,8)",
+        "copies": "Number of copies of each fixture law (default: 20)",
+        "use-copy": "Write laws with PostgreSQL COPY",
+        "batch-size": "Number of laws to commit per transaction (default: 50)",
+        "drop-search-indexes": "Drop the search indexes while loading, rebuild them after"
+    }
+)
+def bench_ingest(c, shards="1,2,4,8", copies=20, use_copy=False, batch_size=50, drop_search_indexes=False):
+    """Measure sharded ingest throughput. Deletes all laws in the configured DB!"""
+    from benchmarks import ingest as ingest_benchmark
+    ingest_benchmark.run([int(n) for n in shards.split(",")], copies, use_copy, batch_size, drop_search_indexes)
+
+
+ns.add_collection(Collection(
+    'bench',
+    parser=bench_parser,
+    parser_suite=bench_parser_suite,
+    serialization=bench_serialization,
+    download=bench_download,
+    ingest=bench_ingest
+))
+
+
 # Ingest tasks
 
 @task(
     help={
-        "data-location": "Where to store downloaded law data (local path or S3 prefix url)"
+        "data-location": "Where to store downloaded law data (local path or S3 prefix url)",
+        "store-zip": "Store each law as the downloaded zip archive instead of extracting it",
+        "concurrency": "Number of parallel requests (default: 8)",
+        "requests-per-second": "Maximum number of requests started per second (default: 20)",
+        "recheck-after-hours": "Skip laws that were checked for updates less than this many hours ago (default: none)"
     }
 )
-def download_laws(c, data_location):
+def download_laws(c, data_location, store_zip=False, concurrency=8, requests_per_second=20, recheck_after_hours=None):
     """
     Download any updated law files from gesetze-im-internet.de.
     """
-    gesetze_im_internet.download_laws(location_from_string(data_location))
+    gesetze_im_internet.download_laws(
+        location_from_string(data_location, store_zip=store_zip),
+        concurrency=concurrency,
+        requests_per_second=requests_per_second,
+        recheck_after=recheck_after_hours and float(recheck_after_hours) * 60 * 60
+    )
 
 
 @task(
     help={
-       "data-location": "Where law data has been downloaded (local path or S3 prefix url)"
+       "data-location": "Where law data has been downloaded (local path or S3 prefix url)",
+       "workers": "Number of processes to parse laws in (default: 1)",
+       "parse-cache-dir": "Directory to cache parse results in, keyed by XML content hash (default: no cache)",
+       "use-copy": "Replace laws wholesale with PostgreSQL COPY instead of the diff-based upsert",
+       "batch-size": "Number of laws to commit per transaction (default: 50)",
+       "rebuild": "Re-ingest all laws into new tables and swap them in when done",
+       "shards": "Number of processes to split laws between, each parsing and writing its share (default: 1)",
+       "drop-search-indexes": "Drop the search indexes while storing laws and rebuild them after (for bulk loads)"
     }
 )
-def ingest_data_from_location(c, data_location):
+def ingest_data_from_location(
+    c, data_location, workers=1, parse_cache_dir=None, use_copy=False, batch_size=50, rebuild=False, shards=1,
+    drop_search_indexes=False
+):
     """
     Process downloaded laws and store/update them in the DB.
     """
+    if rebuild and (use_copy or shards > 1 or drop_search_indexes):
+        raise Exception(
+            "--rebuild always uses COPY and builds the search indexes once; "
+            "it can't be combined with --use-copy, --shards or --drop-search-indexes."
+        )
+    if shards > 1 and workers > 1:
+        raise Exception("Use either --workers or --shards, not both.")
+
+    parse_cache = parse_cache_dir and ParseCache(parse_cache_dir)
+    if rebuild:
+        gesetze_im_internet.rebuild_from_location(
+            location_from_string(data_location), workers=workers, parse_cache=parse_cache, batch_size=batch_size
+        )
+        return
+
     with db.session_scope() as session:
-        gesetze_im_internet.ingest_data_from_location(session, location_from_string(data_location))
+        gesetze_im_internet.ingest_data_from_location(
+            session, location_from_string(data_location), workers=workers, parse_cache=parse_cache,
+            use_copy=use_copy, batch_size=batch_size, shards=shards, drop_search_indexes=drop_search_indexes
+        )
 
 
 ns.add_collection(Collection(
@@ -145,13 +274,17 @@ ns.add_collection(Collection(
 
 # Deployment-related tasks
 
-@task
-def update_bulk_law_files(c):
+@task(
+    help={
+        "workers": "Number of processes to render law JSON in (default: 1)"
+    }
+)
+def update_bulk_law_files(c, workers=1):
     """
     Generate and upload bulk law files.
     """
     with db.session_scope() as session:
-        gesetze_im_internet.generate_and_upload_bulk_law_files(session)
+        gesetze_im_internet.generate_and_upload_bulk_law_files(session, workers=workers)
 
 
 def update_lambda_fn(function_name, s3_key):
@@ -0,0 +1,219 @@
+"""
+Local stand-in for gesetze-im-internet.de, serving a generated gii-toc.xml and per-law zips built from the XML
+fixtures. Supports conditional GETs (ETag/Last-Modified) and records every request it receives.
+
+Also used by the download benchmark (benchmarks/download.py), which is what latency, bandwidth caps, copies and
+churn are for.
+"""
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import os
+import random
+import threading
+import time
+import zipfile
+
+from .utils import xml_fixtures_dir, zip_law_fixture
+
+# Wed, 14 Oct 2020 12:00:00 GMT
+DEFAULT_LAST_MODIFIED = 1602676800
+
+
+_WRITE_CHUNK_SIZE = 16 * 1024
+
+
+def _repack_zip(zip_bytes, compression, xml_comment=None):
+    """Re-pack a law zip with a different compression, optionally changing its XML by appending a comment."""
+    buf = BytesIO()
+    with zipfile.ZipFile(BytesIO(zip_bytes)) as source, zipfile.ZipFile(buf, "w", compression) as target:
+        for name in source.namelist():
+            data = source.read(name)
+            if name.endswith(".xml") and xml_comment:
+                data += f"<!-- {xml_comment} -->\n".encode("utf-8")
+            target.writestr(name, data)
+    return buf.getvalue()
+
+
+class GiiMirror:
+    def __init__(self, slugs=None, copies=1, latency=0, bandwidth=None):
+        """
+        Serve the fixture laws `slugs` (default: all). With `copies` > 1, each law is also served under `copies - 1`
+        more slugs (`<slug>_2`, ...). Every response is delayed by `latency` seconds, and response bodies are sent at
+        no more than `bandwidth` bytes/second each.
+        """
+        slugs = slugs or sorted(os.listdir(xml_fixtures_dir))
+        self.zips = {}
+        for slug in slugs:
+            zip_bytes = zip_law_fixture(slug)
+            for i in range(copies):
+                self.zips[slug if i == 0 else f"{slug}_{i + 1}"] = zip_bytes
+        self.last_modified = {slug: DEFAULT_LAST_MODIFIED for slug in self.zips}
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = []
+        self.bytes_sent = 0
+        self.faults = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def toc_url(self):
+        return f"{self.base_url}/gii-toc.xml"
+
+    def download_url(self, slug):
+        return f"{self.base_url}/{slug}/xml.zip"
+
+    def toc_xml(self):
+        items = "".join(
+            f"<item><title>{slug}</title><link>{self.download_url(slug)}</link></item>" for slug in self.zips
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><items>{items}</items>'.encode("utf-8")
+
+    def touch(self, slug, last_modified):
+        """Set a law's Last-Modified time (unix timestamp)."""
+        self.last_modified[slug] = last_modified
+
+    def churn(self, fraction, changed_fraction=0.0, seed=0):
+        """
+        Bump Last-Modified by a day on a random `fraction` of the laws, like gesetze-im-internet.de does. Of those,
+        `changed_fraction` also get changed content; the others are only re-packed. Returns the bumped slugs.
+        """
+        rng = random.Random(seed)
+        bumped = rng.sample(sorted(self.zips), round(len(self.zips) * fraction))
+        changed = set(rng.sample(bumped, round(len(bumped) * changed_fraction)))
+
+        for slug in bumped:
+            self.last_modified[slug] += 24 * 60 * 60
+            if slug in changed:
+                self.zips[slug] = _repack_zip(
+                    self.zips[slug], zipfile.ZIP_DEFLATED, f"revision {self.last_modified[slug]}"
+                )
+            else:
+                self.zips[slug] = _repack_zip(self.zips[slug], zipfile.ZIP_STORED)
+
+        return bumped
+
+    def fail(self, path, *statuses):
+        """Answer the next requests for `path` with the given error statuses, one per request."""
+        self.faults.setdefault(path, []).extend(statuses)
+
+    def _next_fault(self, path):
+        with self._lock:
+            statuses = self.faults.get(path)
+            return statuses.pop(0) if statuses else None
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = []
+            self.bytes_sent = 0
+
+    def etag(self, slug):
+        return f'"{slug}-{self.last_modified[slug]}"'
+
+    def is_not_modified(self, slug, headers):
+        if headers.get("If-None-Match"):
+            return headers["If-None-Match"] == self.etag(slug)
+        if headers.get("If-Modified-Since"):
+            return self.last_modified[slug] <= parsedate_to_datetime(headers["If-Modified-Since"]).timestamp()
+        return False
+
+    def count_requests(self, method=None, status=None):
+        return len([
+            r for r in self.requests
+            if (method is None or r[0] == method) and (status is None or r[2] == status)
+        ])
+
+    def _record(self, method, path, status, bytes_sent=0):
+        with self._lock:
+            self.requests.append((method, path, status))
+            self.bytes_sent += bytes_sent
+
+    def _write_body(self, wfile, body):
+        if not self.bandwidth:
+            wfile.write(body)
+            return
+
+        for i in range(0, len(body), _WRITE_CHUNK_SIZE):
+            chunk = body[i:i + _WRITE_CHUNK_SIZE]
+            wfile.write(chunk)
+            time.sleep(len(chunk) / self.bandwidth)
+
+    def __enter__(self):
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, send_body):
+                if mirror.latency:
+                    time.sleep(mirror.latency)
+
+                fault_status = mirror._next_fault(self.path)
+                if fault_status:
+                    mirror._record(self.command, self.path, fault_status)
+                    self.send_response(fault_status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                headers = {}
+                if self.path == "/gii-toc.xml":
+                    body = mirror.toc_xml()
+                    headers["ETag"] = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                    if self.headers.get("If-None-Match") == headers["ETag"]:
+                        mirror._record(self.command, self.path, 304)
+                        self.send_response(304)
+                        self.send_header("ETag", headers["ETag"])
+                        self.end_headers()
+                        return
+                else:
+                    slug = self.path.strip("/").split("/")[0]
+                    if slug not in mirror.zips or not self.path.endswith("/xml.zip"):
+                        mirror._record(self.command, self.path, 404)
+                        self.send_error(404)
+                        return
+                    body = mirror.zips[slug]
+                    headers["Last-Modified"] = formatdate(mirror.last_modified[slug], usegmt=True)
+                    headers["ETag"] = mirror.etag(slug)
+
+                    if mirror.is_not_modified(slug, self.headers):
+                        mirror._record(self.command, self.path, 304)
+                        self.send_response(304)
+                        for name, value in headers.items():
+                            self.send_header(name, value)
+                        self.end_headers()
+                        return
+
+                mirror._record(self.command, self.path, 200, len(body) if send_body else 0)
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if send_body:
+                    mirror._write_body(self.wfile, body)
+
+            def do_GET(self):
+                self._respond(send_body=True)
+
+            def do_HEAD(self):
+                self._respond(send_body=False)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
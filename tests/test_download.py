@@ -0,0 +1,422 @@
+import contextlib
+import io
+import os
+import zipfile
+from unittest import mock
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from moto import mock_aws
+import pytest
+import requests
+
+from rip_api import gesetze_im_internet
+from rip_api.gesetze_im_internet import download, s3_transfer
+from rip_api.gesetze_im_internet.parsing import parse_law
+from .mirror import GiiMirror
+from .utils import xml_fixtures_dir, zip_law_fixture
+
+BUCKET = "test-bucket"
+
+
+def mock_zip_response(slug):
+    response = mock.Mock()
+    response.status_code = 200
+    content = zip_law_fixture(slug)
+    response.iter_content = lambda chunk_size: (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+    response.headers = {"Last-Modified": "Wed, 14 Oct 2020 12:00:00 GMT"}
+    return response
+
+
+def expected_law(slug):
+    return parse_law(download.LocalPathLocation(xml_fixtures_dir).xml_file_for(slug))
+
+
+def parse_from_location(location, slug):
+    xml_file = location.xml_file_for(slug)
+    if hasattr(xml_file, "read"):
+        # Older botocore's StreamingBody isn't a context manager.
+        with contextlib.closing(xml_file):
+            return parse_law(xml_file, streaming=True)
+    return parse_law(xml_file)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        client = boto3.client("s3", "eu-central-1")
+        client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-central-1"})
+        yield client
+
+
+@pytest.fixture(params=["local", "s3"])
+def location_factory(request, tmp_path):
+    if request.param == "s3":
+        request.getfixturevalue("s3")
+        return lambda **kwargs: download.location_from_string(f"s3://{BUCKET}/gii", **kwargs)
+    return lambda **kwargs: download.location_from_string(str(tmp_path), **kwargs)
+
+
+@pytest.mark.parametrize("store_zip", [False, True])
+def test_create_or_replace_law_round_trip(location_factory, store_zip):
+    location = location_factory(store_zip=store_zip)
+
+    with mock.patch("requests.get", return_value=mock_zip_response("estg")):
+        location.create_or_replace_law("estg", "http://example.com/estg/xml.zip")
+
+    assert location.list_slugs_with_timestamps() == {"estg": "20201014"}
+    assert location.attachment_names("estg") == ["bgbl1_2017_j2074-1_0010.jpg"]
+    assert parse_from_location(location, "estg") == expected_law("estg")
+
+    location.remove_law("estg")
+    assert location.list_slugs_with_timestamps() == {}
+
+
+@pytest.mark.parametrize("store_zip", [False, True])
+def test_manifest_is_used_by_fresh_location(location_factory, store_zip):
+    location = location_factory(store_zip=store_zip)
+    with mock.patch("requests.get", return_value=mock_zip_response("estg")):
+        location.create_or_replace_law("estg", "http://example.com/estg/xml.zip")
+    location.save_manifest()
+
+    fresh_location = location_factory()
+    with mock.patch.object(fresh_location, "_scan_for_manifest_entries", side_effect=AssertionError("scanned")):
+        assert fresh_location.list_slugs_with_timestamps() == {"estg": "20201014"}
+        assert fresh_location.attachment_names("estg") == ["bgbl1_2017_j2074-1_0010.jpg"]
+        assert parse_from_location(fresh_location, "estg") == expected_law("estg")
+        assert fresh_location.validators_for("estg")["last_modified"] == "Wed, 14 Oct 2020 12:00:00 GMT"
+
+
+@pytest.mark.parametrize("store_zip", [False, True])
+def test_location_without_manifest_is_scanned(location_factory, store_zip):
+    location = location_factory(store_zip=store_zip)
+    with mock.patch("requests.get", return_value=mock_zip_response("estg")):
+        location.create_or_replace_law("estg", "http://example.com/estg/xml.zip")
+
+    fresh_location = location_factory()
+    assert fresh_location.list_slugs_with_timestamps() == {"estg": "20201014"}
+    assert fresh_location.attachment_names("estg") == ["bgbl1_2017_j2074-1_0010.jpg"]
+    assert parse_from_location(fresh_location, "estg") == expected_law("estg")
+    assert fresh_location.validators_for("estg") is None
+
+
+@pytest.mark.parametrize("store_zip", [False, True])
+def test_large_downloads_are_spooled_to_disk(location_factory, store_zip):
+    location = location_factory(store_zip=store_zip)
+    location.DOWNLOAD_SPOOL_MAX_MEMORY = 1024
+    spooled_files = []
+
+    def spool_response(response, max_memory):
+        spooled = spool_response.wrapped(response, max_memory)
+        spooled_files.append(spooled)
+        return spooled
+
+    spool_response.wrapped = download._spool_response
+    with mock.patch("requests.get", return_value=mock_zip_response("estg")), \
+            mock.patch.object(download, "_spool_response", spool_response):
+        location.create_or_replace_law("estg", "http://example.com/estg/xml.zip")
+
+    assert not isinstance(spooled_files[0], io.BytesIO)
+    assert location.attachment_names("estg") == ["bgbl1_2017_j2074-1_0010.jpg"]
+    assert parse_from_location(location, "estg") == expected_law("estg")
+    assert location.validators_for("estg") is not None
+
+
+def test_zip_file_objects_are_closed_with_their_members():
+    archive_file = io.BytesIO(zip_law_fixture("estg"))
+    with download._open_xml_in_zip(archive_file) as xml_file:
+        assert parse_law(xml_file, streaming=True) == expected_law("estg")
+        assert not archive_file.closed
+    assert archive_file.closed
+
+    archive_file = io.BytesIO(zip_law_fixture("estg"))
+    assert download._attachment_names_in_zip(archive_file) == ["bgbl1_2017_j2074-1_0010.jpg"]
+    assert archive_file.closed
+
+
+def test_zip_mode_stores_single_archive(s3):
+    location = download.S3Location(f"s3://{BUCKET}/gii", store_zip=True)
+
+    with mock.patch("requests.get", return_value=mock_zip_response("estg")):
+        location.create_or_replace_law("estg", "http://example.com/estg/xml.zip")
+
+    keys = sorted(obj["Key"] for obj in s3.list_objects_v2(Bucket=BUCKET)["Contents"])
+    assert keys == ["gii/estg/.last_modified_20201014", "gii/estg/xml.zip"]
+
+
+def test_s3_remove_law_deletes_more_than_one_batch_of_keys(s3):
+    keys = ["gii/estg/law.xml"] + [f"gii/estg/{i}.jpg" for i in range(s3_transfer.DELETE_BATCH_SIZE + 5)]
+    s3_transfer.put_objects(BUCKET, ((key, b"") for key in keys + ["gii/estgx/law.xml"]))
+
+    download.S3Location(f"s3://{BUCKET}/gii").remove_law("estg")
+
+    remaining = [obj["Key"] for obj in s3.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert remaining == ["gii/estgx/law.xml"]
+
+
+def test_upload_file_to_s3_uses_multipart_for_large_files(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(gesetze_im_internet, "ASSET_BUCKET", BUCKET)
+    part_size = 5 * 1024 * 1024  # S3's minimum part size
+    monkeypatch.setattr(
+        s3_transfer, "TRANSFER_CONFIG", TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size)
+    )
+    local_path = tmp_path / "all_laws.tar.gz"
+    local_path.write_bytes(os.urandom(2 * part_size + 1))
+
+    gesetze_im_internet.upload_file_to_s3(str(local_path), "public/all_laws.tar.gz")
+
+    obj = s3.get_object(Bucket=BUCKET, Key="public/all_laws.tar.gz")
+    assert obj["Body"].read() == local_path.read_bytes()
+    # Multipart ETags end in the number of parts.
+    assert obj["ETag"].strip('"').endswith("-3")
+
+
+def test_s3_range_reader_reads_and_seeks(s3):
+    s3.put_object(Bucket=BUCKET, Key="blob", Body=b"0123456789")
+    reader = download._S3RangeReader(s3, BUCKET, "blob")
+
+    assert reader.read(4) == b"0123"
+    reader.seek(-3, 2)
+    assert reader.read() == b"789"
+    reader.seek(2)
+    assert reader.read(100) == b"23456789"
+    assert reader.read(1) == b""
+
+
+def test_download_laws_concurrently_from_mirror(tmp_path):
+    location = download.LocalPathLocation(str(tmp_path))
+
+    with GiiMirror() as mirror:
+        gesetze_im_internet.download_laws(location, concurrency=4, toc_url=mirror.toc_url)
+
+        slugs = sorted(os.listdir(xml_fixtures_dir))
+        assert sorted(location.list_slugs_with_timestamps()) == slugs
+        assert location.attachment_names("estg") == ["bgbl1_2017_j2074-1_0010.jpg"]
+        assert mirror.count_requests("GET", 200) == 1 + len(slugs)
+
+        # Nothing changed: a single conditional GET for the toc and per law.
+        mirror.requests.clear()
+        gesetze_im_internet.download_laws(location, concurrency=4, toc_url=mirror.toc_url)
+        assert mirror.count_requests("HEAD") == 0
+        assert mirror.count_requests("GET", 304) == 1 + len(slugs)
+        assert mirror.count_requests("GET", 200) == 0
+
+        # One law changed later the same day.
+        mirror.requests.clear()
+        mirror.zips["jfdg"] = zip_law_fixture("skaufg")
+        mirror.touch("jfdg", mirror.last_modified["jfdg"] + 3600)
+        stats = gesetze_im_internet.download_laws(location, concurrency=4, toc_url=mirror.toc_url)
+        assert stats == {"downloaded": 1, "identical": 0, "not_modified": len(slugs) - 1, "skipped": 0, "removed": 0}
+        assert ("GET", "/jfdg/xml.zip", 200) in mirror.requests
+        assert location.validators_for("jfdg")["etag"] == mirror.etag("jfdg")
+
+
+def test_download_laws_after_mirror_churn(tmp_path):
+    location = download.LocalPathLocation(str(tmp_path))
+
+    with GiiMirror(["jfdg", "skaufg"], copies=5) as mirror:
+        gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url)
+        bumped = mirror.churn(0.4, changed_fraction=0.5)
+        mirror.reset_stats()
+        stats = gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url)
+
+    assert len(location.list_slugs_with_timestamps()) == 10
+    assert stats == {"downloaded": 2, "identical": 2, "not_modified": 6, "skipped": 0, "removed": 0}
+    assert mirror.count_requests("GET", 200) == len(bumped)
+
+
+def test_download_laws_skips_recently_checked_laws(tmp_path):
+    location = download.LocalPathLocation(str(tmp_path))
+
+    with GiiMirror(["jfdg", "skaufg"]) as mirror:
+        gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url)
+
+        # Toc unchanged and all laws checked recently: only the conditional toc request.
+        mirror.reset_stats()
+        stats = gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url, recheck_after=3600)
+        assert stats == {"downloaded": 0, "identical": 0, "not_modified": 0, "skipped": 2, "removed": 0}
+        assert mirror.requests == [("GET", "/gii-toc.xml", 304)]
+
+        # New laws in the toc are downloaded regardless.
+        mirror.zips["alg"] = zip_law_fixture("alg")
+        mirror.last_modified["alg"] = mirror.last_modified["jfdg"]
+        mirror.reset_stats()
+        stats = gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url, recheck_after=3600)
+        assert stats == {"downloaded": 1, "identical": 0, "not_modified": 0, "skipped": 2, "removed": 0}
+        assert mirror.count_requests("GET", 200) == 2
+
+
+def test_fetch_toc_incrementally():
+    with GiiMirror(["jfdg", "skaufg"]) as mirror:
+        toc, state, changed = download.fetch_toc_incrementally(requests, mirror.toc_url)
+        assert toc == {"jfdg": mirror.download_url("jfdg"), "skaufg": mirror.download_url("skaufg")}
+        assert changed
+
+        assert download.fetch_toc_incrementally(requests, mirror.toc_url, state) == (toc, state, False)
+        assert mirror.requests[-1] == ("GET", "/gii-toc.xml", 304)
+
+        # Served again in full (e.g. without validators), but with the same laws.
+        state_without_validators = {**state, "validators": None}
+        _, _, changed = download.fetch_toc_incrementally(requests, mirror.toc_url, state_without_validators)
+        assert not changed
+
+        del mirror.zips["skaufg"]
+        toc, _, changed = download.fetch_toc_incrementally(requests, mirror.toc_url, state)
+        assert toc == {"jfdg": mirror.download_url("jfdg")}
+        assert changed
+
+
+def test_download_laws_falls_back_to_stored_date_without_validators(tmp_path):
+    location = download.LocalPathLocation(str(tmp_path))
+
+    with GiiMirror(["jfdg", "skaufg"]) as mirror:
+        gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url)
+        # A location downloaded before validators were stored in a manifest.
+        os.remove(tmp_path / download.MANIFEST_NAME)
+        mirror.touch("skaufg", download.parsedate_to_datetime("Thu, 15 Oct 2020 08:00:00 GMT").timestamp())
+
+        mirror.requests.clear()
+        gesetze_im_internet.download_laws(download.LocalPathLocation(str(tmp_path)), toc_url=mirror.toc_url)
+
+        assert ("GET", "/jfdg/xml.zip", 304) in mirror.requests
+        assert ("GET", "/skaufg/xml.zip", 200) in mirror.requests
+        assert download.LocalPathLocation(str(tmp_path)).list_slugs_with_timestamps()["skaufg"] == "20201015"
+
+
+def test_download_laws_refetches_laws_without_stored_date(tmp_path):
+    location = download.LocalPathLocation(str(tmp_path))
+
+    with GiiMirror(["jfdg", "skaufg"]) as mirror:
+        gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url)
+        os.remove(tmp_path / download.MANIFEST_NAME)
+        os.remove(tmp_path / "skaufg" / ".timestamp")
+
+        mirror.requests.clear()
+        gesetze_im_internet.download_laws(download.LocalPathLocation(str(tmp_path)), toc_url=mirror.toc_url)
+
+        assert ("GET", "/jfdg/xml.zip", 304) in mirror.requests
+        assert ("GET", "/skaufg/xml.zip", 200) in mirror.requests
+
+
+@pytest.mark.parametrize("store_zip", [False, True])
+def test_validators_are_stored(location_factory, store_zip):
+    location = location_factory(store_zip=store_zip)
+    assert location.validators_for("jfdg") is None
+
+    with GiiMirror(["jfdg"]) as mirror:
+        assert location.create_or_replace_law("jfdg", mirror.download_url("jfdg")) == download.DOWNLOADED
+        validators = location.validators_for("jfdg")
+        assert validators == {"last_modified": "Wed, 14 Oct 2020 12:00:00 GMT", "etag": mirror.etag("jfdg")}
+
+        result = location.create_or_replace_law("jfdg", mirror.download_url("jfdg"), validators=validators)
+        assert result == download.NOT_MODIFIED
+        assert location.attachment_names("jfdg") == []
+
+
+@pytest.mark.parametrize("store_zip", [False, True])
+def test_modified_but_identical_law_is_not_rewritten(location_factory, store_zip):
+    location = location_factory(store_zip=store_zip)
+
+    with GiiMirror(["estg"]) as mirror:
+        location.create_or_replace_law("estg", mirror.download_url("estg"))
+
+        # Same files, re-packed and with a new Last-Modified.
+        mirror.zips["estg"] = zip_law_fixture("estg", zipfile.ZIP_STORED)
+        mirror.touch("estg", download.parsedate_to_datetime("Thu, 15 Oct 2020 08:00:00 GMT").timestamp())
+        with mock.patch.object(location, "_store_law_files") as store_law_files:
+            result = location.create_or_replace_law("estg", mirror.download_url("estg"), validators={})
+
+        assert result == download.IDENTICAL
+        store_law_files.assert_not_called()
+        assert location.list_slugs_with_timestamps() == {"estg": "20201014"}
+        assert location.validators_for("estg")["last_modified"] == "Thu, 15 Oct 2020 08:00:00 GMT"
+        assert parse_from_location(location, "estg") == expected_law("estg")
+
+        # Actually changed files are stored.
+        mirror.zips["estg"] = zip_law_fixture("jfdg")
+        assert location.create_or_replace_law("estg", mirror.download_url("estg"), validators={}) == download.DOWNLOADED
+        assert location.list_slugs_with_timestamps() == {"estg": "20201015"}
+        assert location.attachment_names("estg") == []
+
+
+def test_fetcher_retries_throttled_and_failed_requests(tmp_path):
+    location = download.LocalPathLocation(str(tmp_path))
+
+    with GiiMirror(["jfdg", "skaufg"]) as mirror:
+        mirror.fail("/gii-toc.xml", 503)
+        mirror.fail("/jfdg/xml.zip", 429, 502)
+        fetcher = download.Fetcher(concurrency=4, requests_per_second=None, backoff_base=0.01)
+        with mock.patch.object(gesetze_im_internet, "Fetcher", return_value=fetcher):
+            stats = gesetze_im_internet.download_laws(location, toc_url=mirror.toc_url)
+
+    assert stats["downloaded"] == 2
+    assert fetcher.retries == 3
+    # Backed off from the initial 2 and only a couple of successes since.
+    assert fetcher.controller.limit <= 2
+    assert fetcher.controller.peak_limit == 2
+    assert "3 retries" in fetcher.summary()
+
+
+def test_fetcher_gives_up_after_max_retries():
+    with GiiMirror(["jfdg"]) as mirror:
+        mirror.fail("/jfdg/xml.zip", 503, 503, 503)
+        fetcher = download.Fetcher(requests_per_second=None, max_retries=2, backoff_base=0.01)
+
+        with pytest.raises(requests.HTTPError):
+            download._fetch_law(mirror.download_url("jfdg"), fetcher, None)
+        assert fetcher.retries == 2
+        # All slots were released.
+        assert fetcher.controller._in_flight == 0
+
+
+def test_concurrency_controller_aimd():
+    controller = download.ConcurrencyController(max_concurrency=8, initial_concurrency=4)
+
+    for _ in range(4):
+        controller.record(controller.acquire())
+        controller.release()
+    assert controller.limit == 5
+
+    # Requests that were in flight together only halve the limit once.
+    starts = [controller.acquire() for _ in range(3)]
+    for start in starts:
+        controller.record(start, overloaded=True)
+        controller.release()
+    assert controller.limit == 2
+
+    controller.record(controller.acquire(), overloaded=True)
+    controller.release()
+    assert controller.limit == 1
+
+    for _ in range(100):
+        controller.record(controller.acquire())
+        controller.release()
+    assert controller.limit == 8
+    assert controller.peak_limit == 8
+
+
+def test_concurrency_controller_treats_slow_requests_as_overload():
+    controller = download.ConcurrencyController(max_concurrency=8, initial_concurrency=4)
+    controller.record(controller.acquire())
+    controller.release()
+
+    start = controller.acquire()
+    with mock.patch("time.monotonic", return_value=start + controller.SLOW_LATENCY_MIN + 1):
+        controller.record(start)
+    controller.release()
+
+    assert controller.limit == 2
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    rate_limiter = download.RateLimiter(requests_per_second=20)
+
+    # All requests arrive at the same instant.
+    with mock.patch("time.monotonic", return_value=100.0), mock.patch("time.sleep") as sleep:
+        for _ in range(5):
+            rate_limiter.wait("http://example.com/a")
+        rate_limiter.wait("http://example.org/b")
+
+    assert [call.args[0] for call in sleep.call_args_list] == pytest.approx([0.05, 0.1, 0.15, 0.2])
@@ -0,0 +1,465 @@
+import contextlib
+import copy
+import itertools
+import os
+
+import pytest
+
+from rip_api import db, gesetze_im_internet, models
+from rip_api.gesetze_im_internet import copy_loader, diff_loader
+from rip_api.gesetze_im_internet.download import LocalPathLocation
+from rip_api.gesetze_im_internet.parse_cache import ParseCache
+from rip_api.gesetze_im_internet.parsing import parse_law
+from .mirror import GiiMirror
+from .utils import xml_fixtures_dir
+
+fixture_slugs = sorted(os.listdir(xml_fixtures_dir))
+
+
+@pytest.fixture(autouse=True, scope="module")
+def init_db():
+    db.init_db()
+
+
+@pytest.fixture
+def empty_db():
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+
+
+@pytest.fixture
+def location():
+    return LocalPathLocation(xml_fixtures_dir)
+
+
+def test_parsing_in_worker_processes_matches_serial_parsing(location):
+    serial = list(gesetze_im_internet._parse_laws(location, fixture_slugs, workers=1))
+    parallel = list(gesetze_im_internet._parse_laws(location, fixture_slugs, workers=2))
+
+    assert [parsed.gii_slug for parsed in parallel] == fixture_slugs
+    assert parallel == serial
+
+
+@pytest.mark.parametrize("spool_max_memory", [gesetze_im_internet.XML_SPOOL_MAX_MEMORY, 1])
+def test_parsing_streamed_xml_matches_xml_on_disk(location, tmp_path, monkeypatch, spool_max_memory):
+    monkeypatch.setattr(gesetze_im_internet, "XML_SPOOL_MAX_MEMORY", spool_max_memory)
+    zip_location = LocalPathLocation(str(tmp_path), store_zip=True)
+    with GiiMirror(["estg"]) as mirror:
+        gesetze_im_internet.download_laws(zip_location, toc_url=mirror.toc_url)
+
+    with contextlib.closing(zip_location.xml_file_for("estg")) as xml_file:
+        assert hasattr(xml_file, "read")
+    assert gesetze_im_internet._parse_law_from_location(zip_location, "estg") == \
+        gesetze_im_internet._parse_law_from_location(location, "estg")
+
+
+def test_ingest_data_from_location_with_workers(empty_db, location):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location, workers=2)
+
+    with db.session_scope() as session:
+        assert sorted(slug for slug, in db.all_gii_slugs(session)) == fixture_slugs
+        law = db.find_law_by_slug(session, "estg")
+        assert law.attachment_names == ["bgbl1_2017_j2074-1_0010.jpg"]
+        assert len(law.contents) == 269
+
+
+def test_shard_slugs_splits_slugs_stably():
+    shards = gesetze_im_internet._shard_slugs(fixture_slugs, 3)
+
+    assert sorted(slug for shard in shards for slug in shard) == fixture_slugs
+    assert gesetze_im_internet._shard_slugs(reversed(fixture_slugs), 3) == shards
+
+
+def test_sharded_ingest_produces_same_rows_as_serial_ingest(empty_db, location):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location)
+    with db.session_scope() as session:
+        serial_rows = _dump_rows(session)
+        session.query(models.Law).delete()
+
+    with db.session_scope() as session:
+        stats = gesetze_im_internet.ingest_data_from_location(session, location, shards=2, batch_size=2)
+    with db.session_scope() as session:
+        sharded_rows = _dump_rows(session)
+
+    assert stats["stored"] == len(fixture_slugs)
+    assert sharded_rows == serial_rows
+
+
+def _search_indexes():
+    with db.session_scope() as session:
+        return session.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE indexdef LIKE '% USING gin %' ORDER BY indexname"
+        ).fetchall()
+
+
+def test_ingest_can_drop_search_indexes_while_storing_laws(empty_db, location, monkeypatch):
+    indexes = _search_indexes()
+    assert len(indexes) == 2
+
+    store_law = diff_loader.store_law
+    indexes_while_storing = []
+
+    def store_law_and_check_indexes(*args):
+        indexes_while_storing.append(_search_indexes())
+        return store_law(*args)
+
+    monkeypatch.setattr(diff_loader, "store_law", store_law_and_check_indexes)
+    with db.session_scope() as session:
+        stats = gesetze_im_internet.ingest_data_from_location(session, location, drop_search_indexes=True)
+
+    assert indexes_while_storing == [[]] * len(fixture_slugs)
+    assert _search_indexes() == indexes
+    assert stats["index_rebuild_seconds"] > 0
+    with db.session_scope() as session:
+        results = db.fulltext_search_laws_content_items(session, "Jugendfreiwilligendienst", 1, 10, "laws")
+        assert [law.gii_slug for law in results.items] == ["jfdg"]
+
+
+def test_dropped_search_indexes_are_rebuilt_when_ingest_fails(empty_db, location, monkeypatch):
+    indexes = _search_indexes()
+
+    def fail(*args):
+        raise RuntimeError()
+
+    monkeypatch.setattr(diff_loader, "store_law", fail)
+    with pytest.raises(RuntimeError):
+        with db.session_scope() as session:
+            gesetze_im_internet.ingest_data_from_location(session, location, drop_search_indexes=True)
+
+    assert _search_indexes() == indexes
+
+
+def test_work_left_uncommitted_with_search_indexes_dropped_is_kept(empty_db, location):
+    law_dict = parse_law(location.xml_file_for("jfdg"))
+    with db.session_scope() as session:
+        with db.search_indexes_dropped(session):
+            diff_loader.store_law(session, law_dict, "jfdg", [])
+
+    with db.session_scope() as session:
+        assert db.all_gii_slugs(session) == [("jfdg",)]
+
+
+def test_ingest_commits_in_batches_and_empties_session(empty_db, location):
+    with db.session_scope() as session:
+        commit = session.commit
+        commits = []
+        session.commit = lambda: (commits.append(1), commit())
+
+        stats = gesetze_im_internet.ingest_data_from_location(session, location, batch_size=2)
+
+        # One commit per batch of laws, plus one each for slug fixups and deleting removed laws.
+        assert len(commits) == -(-len(fixture_slugs) // 2) + 2
+        assert stats["stored"] == len(fixture_slugs)
+        assert stats["peak_rss_mb"] > 0
+        assert len(session.identity_map) == 0
+
+    with db.session_scope() as session:
+        assert sorted(slug for slug, in db.all_gii_slugs(session)) == fixture_slugs
+
+
+def test_ingest_skips_laws_with_unchanged_xml(empty_db, location, tmp_path):
+    parse_cache = ParseCache(str(tmp_path))
+
+    with db.session_scope() as session:
+        stats = gesetze_im_internet.ingest_data_from_location(session, location, parse_cache=parse_cache)
+    assert stats["stored"] == len(fixture_slugs)
+    assert stats["cache_miss"] == len(fixture_slugs)
+
+    # Pretend all laws have been re-downloaded since the last ingest, and that estg's attachments changed.
+    with db.session_scope() as session:
+        source_timestamps = dict(session.query(models.Law.gii_slug, models.Law.source_timestamp))
+        session.query(models.Law).update({"location_timestamp": "0"})
+        session.query(models.Law).filter_by(gii_slug="estg").update({"attachment_names": []})
+
+    with db.session_scope() as session:
+        stats = gesetze_im_internet.ingest_data_from_location(session, location, parse_cache=parse_cache)
+    assert stats["stored"] == 0
+    assert stats["unchanged"] == len(fixture_slugs)
+
+    # Unchanged laws still get the location's attachments and timestamp, so they aren't read again next time. Their
+    # source timestamp (the XML's builddate) stays as it is.
+    with db.session_scope() as session:
+        assert db.find_law_by_slug(session, "estg").attachment_names == ["bgbl1_2017_j2074-1_0010.jpg"]
+        assert dict(session.query(models.Law.gii_slug, models.Law.source_timestamp)) == source_timestamps
+        location_timestamps = dict(session.query(models.Law.gii_slug, models.Law.location_timestamp))
+        assert location_timestamps == location.list_slugs_with_timestamps()
+        stats = gesetze_im_internet.ingest_data_from_location(session, location, parse_cache=parse_cache)
+    assert stats["stored"] == stats["unchanged"] == 0
+
+    # Laws ingested from identical XML are served from the cache.
+    with db.session_scope() as session:
+        session.query(models.Law).update({"location_timestamp": "0", "source_hash": None})
+
+    with db.session_scope() as session:
+        stats = gesetze_im_internet.ingest_data_from_location(session, location, parse_cache=parse_cache)
+    assert stats["stored"] == len(fixture_slugs)
+    assert stats["cache_hit"] == len(fixture_slugs)
+
+
+def _dump_rows(session):
+    """All law and content item rows, with ids replaced by doknrs."""
+    laws = [
+        {key: value for key, value in row.items() if key != "id"}
+        for row in session.execute("SELECT * FROM laws ORDER BY doknr")
+    ]
+    content_items = [
+        {key: value for key, value in row.items() if key not in ("id", "law_id", "parent_id")}
+        for row in session.execute(
+            "SELECT c.*, l.doknr AS law_doknr, p.doknr AS parent_doknr FROM content_items c "
+            "JOIN laws l ON c.law_id = l.id LEFT JOIN content_items p ON c.parent_id = p.id ORDER BY c.doknr"
+        )
+    ]
+    return laws, content_items
+
+
+def test_copy_loader_produces_same_rows_as_diff_loader(empty_db, location):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location)
+    with db.session_scope() as session:
+        orm_rows = _dump_rows(session)
+
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location, use_copy=True)
+    with db.session_scope() as session:
+        copy_rows = _dump_rows(session)
+        # The ORM can load what was copied.
+        law = db.find_law_by_slug(session, "estg")
+        child = next(item for item in law.contents if item.parent_id)
+        assert child.parent in law.contents
+
+    assert len(copy_rows[1]) > 500
+    assert copy_rows == orm_rows
+
+
+def test_copy_loader_replaces_law_with_same_doknr(empty_db, location):
+    law_dict = parse_law(location.xml_file_for("jfdg"))
+
+    with db.session_scope() as session:
+        copy_loader.store_law(session, law_dict, "jfdg", [], "old-hash")
+    with db.session_scope() as session:
+        copy_loader.store_law(session, law_dict, "jfdg", ["a.jpg"], "new-hash")
+
+    with db.session_scope() as session:
+        law, = session.query(models.Law).all()
+        assert (law.source_hash, law.attachment_names) == ("new-hash", ["a.jpg"])
+        assert session.query(models.ContentItem).count() == len(law_dict["contents"])
+
+
+def _row_versions(session):
+    # xmin is the id of the transaction that last wrote a row.
+    return dict(session.execute("SELECT doknr, xmin::text FROM content_items").fetchall())
+
+
+def _rows_after_fresh_store(law_dict):
+    with db.session_scope() as session:
+        session.query(models.Law).delete()
+    with db.session_scope() as session:
+        copy_loader.store_law(session, law_dict, "skaufg", [])
+    with db.session_scope() as session:
+        return _dump_rows(session)
+
+
+def test_diff_loader_only_writes_changed_content_items(empty_db, location):
+    law_dict = parse_law(location.xml_file_for("skaufg"))
+    with db.session_scope() as session:
+        diff_loader.store_law(session, law_dict, "skaufg", [])
+    with db.session_scope() as session:
+        versions_before = _row_versions(session)
+
+    changed = copy.deepcopy(law_dict)
+    contents = changed["contents"]
+    contents[5]["body"] = "<P>Geändert.</P>"
+    contents[3]["parent"] = None
+    removed = contents.pop()
+    contents.append({**removed, "doknr": "NEW", "name": "§ 99"})
+
+    with db.session_scope() as session:
+        diff_loader.store_law(session, changed, "skaufg", [])
+    with db.session_scope() as session:
+        rows = _dump_rows(session)
+        versions_after = _row_versions(session)
+
+    rewritten = {doknr for doknr, version in versions_after.items() if versions_before.get(doknr) != version}
+    assert rewritten == {contents[3]["doknr"], contents[5]["doknr"], "NEW"}
+    assert removed["doknr"] not in versions_after
+    assert rows == _rows_after_fresh_store(changed)
+
+
+def test_diff_loader_reparents_children_of_removed_items(empty_db, location):
+    law_dict = parse_law(location.xml_file_for("skaufg"))
+    with db.session_scope() as session:
+        diff_loader.store_law(session, law_dict, "skaufg", [])
+
+    changed = copy.deepcopy(law_dict)
+    heading = changed["contents"][2]
+    changed["contents"].remove(heading)
+    for item in changed["contents"]:
+        if item["parent"] is heading:
+            item["parent"] = None
+
+    with db.session_scope() as session:
+        diff_loader.store_law(session, changed, "skaufg", [])
+    with db.session_scope() as session:
+        rows = _dump_rows(session)
+
+    assert rows == _rows_after_fresh_store(changed)
+
+
+def test_bulk_delete_laws_by_gii_slug_cascades_to_content_items(empty_db, location):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location)
+    with db.session_scope() as session:
+        total_items = session.query(models.ContentItem).count()
+        removed_items = (
+            session.query(models.ContentItem).join(models.Law).filter(models.Law.gii_slug.in_(["alg", "jfdg"])).count()
+        )
+        deleted = db.bulk_delete_laws_by_gii_slug(session, ["alg", "jfdg", "unknown"], chunk_size=2)
+
+    assert (deleted["laws"], deleted["content_items"]) == (2, removed_items)
+    with db.session_scope() as session:
+        assert sorted(slug for slug, in db.all_gii_slugs(session)) == ["estg", "ifsg", "skaufg"]
+        assert session.query(models.ContentItem).count() == total_items - removed_items
+
+
+def _table_ddl(session):
+    indexes = session.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE tablename IN ('laws', 'content_items') ORDER BY indexname"
+    ).fetchall()
+    constraints = session.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid IN ('laws'::regclass, 'content_items'::regclass) ORDER BY conname"
+    ).fetchall()
+    # Includes the id columns' sequences.
+    column_defaults = session.execute(
+        "SELECT table_name, column_name, column_default FROM information_schema.columns "
+        "WHERE table_name IN ('laws', 'content_items') AND column_default IS NOT NULL ORDER BY 1, 2"
+    ).fetchall()
+    return indexes, constraints, column_defaults
+
+
+def _leftover_schemas(session):
+    return session.execute("SELECT nspname FROM pg_namespace WHERE nspname LIKE 'ingest_%'").fetchall()
+
+
+def test_rebuild_replaces_tables_with_freshly_ingested_ones(empty_db, location):
+    with db.session_scope() as session:
+        gesetze_im_internet.ingest_data_from_location(session, location)
+    with db.session_scope() as session:
+        rows = _dump_rows(session)
+        ddl = _table_ddl(session)
+        # Left over from a law that has since been removed.
+        session.execute("UPDATE laws SET gii_slug = 'removed', doknr = 'removed' WHERE gii_slug = 'jfdg'")
+
+    stats = gesetze_im_internet.rebuild_from_location(location, batch_size=2)
+
+    assert stats["stored"] == len(fixture_slugs)
+    with db.session_scope() as session:
+        assert _dump_rows(session) == rows
+        assert _table_ddl(session) == ddl
+        assert _leftover_schemas(session) == []
+
+
+def test_shadow_session_scope_is_invisible_to_readers_and_discarded_on_error(empty_db, location):
+    with db.session_scope() as session:
+        diff_loader.store_law(session, parse_law(location.xml_file_for("jfdg")), "jfdg", [])
+
+    with pytest.raises(RuntimeError):
+        with db.shadow_session_scope() as shadow_session:
+            diff_loader.store_law(shadow_session, parse_law(location.xml_file_for("skaufg")), "skaufg", [])
+            shadow_session.commit()
+            assert [slug for slug, in db.all_gii_slugs(shadow_session)] == ["skaufg"]
+
+            with db.session_scope() as session:
+                assert [slug for slug, in db.all_gii_slugs(session)] == ["jfdg"]
+            raise RuntimeError()
+
+    with db.session_scope() as session:
+        assert [slug for slug, in db.all_gii_slugs(session)] == ["jfdg"]
+        assert _leftover_schemas(session) == []
+
+
+class FakeInvoker:
+    """Stands in for a Lambda function invoking itself: records payloads, to be run one after another."""
+
+    def __init__(self):
+        self.payloads = []
+
+    def __call__(self, payload):
+        self.payloads.append(payload)
+
+
+def _continue_run(location, run_id, invoker, generate_bulk_files, batches_per_invocation=2):
+    # Each invocation has time for `batches_per_invocation` batches, or for generating the bulk files.
+    clock = itertools.count(batches_per_invocation, -1)
+    with db.session_scope() as session:
+        return gesetze_im_internet.continue_ingest_run(
+            session, location, run_id, time_remaining=lambda: next(clock), invoke=invoker, batch_size=1,
+            reserve_seconds=0, bulk_files_seconds=batches_per_invocation, generate_bulk_files=generate_bulk_files
+        )
+
+
+def test_ingest_run_continues_across_invocations_until_done(empty_db, location):
+    removed_law = {**parse_law(location.xml_file_for("jfdg")), "doknr": "removed", "contents": []}
+    with db.session_scope() as session:
+        diff_loader.store_law(session, removed_law, "removed", [])
+
+    slugs_when_generating_bulk_files = []
+
+    def generate_bulk_files(session):
+        slugs_when_generating_bulk_files.append(sorted(slug for slug, in db.all_gii_slugs(session)))
+
+    with db.session_scope() as session:
+        run_id = gesetze_im_internet.start_ingest_run(session, location)
+
+    invoker = FakeInvoker()
+    phases = [_continue_run(location, run_id, invoker, generate_bulk_files)]
+    while len(invoker.payloads) == len(phases):
+        phases.append(_continue_run(location, invoker.payloads[-1]["run_id"], invoker, generate_bulk_files))
+
+    # 2 + 2 + 1 laws, then the bulk files in an invocation of their own.
+    assert phases == ["ingest", "ingest", "bulk_files", "done"]
+    assert invoker.payloads == [{"run_id": run_id}] * 3
+    assert slugs_when_generating_bulk_files == [fixture_slugs]
+    with db.session_scope() as session:
+        run = session.query(models.IngestRun).get(run_id)
+        assert run.pending_slugs == []
+        assert run.stats == {"stored": len(fixture_slugs), "removed": 1}
+
+
+def test_ingest_run_is_done_after_writing_bulk_files(empty_db, location, tmp_path):
+    def generate_bulk_files(session):
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path))
+
+    with db.session_scope() as session:
+        run_id = gesetze_im_internet.start_ingest_run(session, location)
+
+    invoker = FakeInvoker()
+    phases = [_continue_run(location, run_id, invoker, generate_bulk_files)]
+    # Bounded, so that a run that never gets done fails the test rather than hanging it.
+    while len(invoker.payloads) == len(phases) and len(phases) < 10:
+        phases.append(_continue_run(location, invoker.payloads[-1]["run_id"], invoker, generate_bulk_files))
+
+    assert phases[-1] == "done"
+    assert (tmp_path / "all_laws.json.gz").exists()
+    assert len(os.listdir(tmp_path / "laws")) == len(fixture_slugs)
+    with db.session_scope() as session:
+        assert session.query(models.IngestRun).get(run_id).phase == "done"
+
+
+def test_ingest_run_resumes_from_journal_and_yields_to_newer_run(empty_db, location):
+    with db.session_scope() as session:
+        first_run_id = gesetze_im_internet.start_ingest_run(session, location)
+
+    invoker = FakeInvoker()
+    assert _continue_run(location, first_run_id, invoker, generate_bulk_files=None) == "ingest"
+    with db.session_scope() as session:
+        assert len(db.all_gii_slugs(session)) == 2
+        second_run_id = gesetze_im_internet.start_ingest_run(session, location)
+        assert session.query(models.IngestRun).get(second_run_id).pending_slugs == fixture_slugs[2:]
+
+    assert _continue_run(location, first_run_id, invoker, generate_bulk_files=None) == "superseded"
+    assert invoker.payloads == [{"run_id": first_run_id}]
@@ -1,8 +1,10 @@
+import gzip
+import io
 import json
 
 import pytest
 
-from rip_api import api_schemas, db, gesetze_im_internet
+from rip_api import api_schemas, db, gesetze_im_internet, models
 from rip_api.gesetze_im_internet.download import location_from_string
 from .utils import load_example_json, xml_fixtures_dir
 
@@ -26,3 +28,63 @@ def test_examples(slug):
 
     expected = load_example_json(slug)["data"]
     assert parsed == expected
+
+
+def test_write_all_law_json_files_streams_same_json_as_dumping_all_laws_at_once(tmp_path):
+    with db.session_scope() as session:
+        data_location = location_from_string(xml_fixtures_dir)
+        for slug in example_law_slugs:
+            gesetze_im_internet.ingest_law(session, data_location, slug)
+
+    with db.session_scope() as session:
+        expected = json.dumps({"data": [
+            api_schemas.LawAllFields.from_orm_model(law, include_contents=True).dict()
+            for law in sorted(db.all_laws(session), key=lambda law: law.id)
+        ]}, indent=2) + "\n"
+
+    with db.session_scope() as session:
+        # Objects of the caller's stay in the session, only the laws and their contents are expunged.
+        run = models.IngestRun(phase="bulk_files", pending_slugs=[], removed_slugs=[], stats={})
+        session.add(run)
+        session.flush()
+
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path))
+
+        assert run in session
+        assert list(session.identity_map.values()) == [run]
+        session.rollback()
+
+    with gzip.open(tmp_path / "all_laws.json.gz", "rt", encoding="utf-8") as f:
+        assert f.read() == expected
+    assert {f"{slug}.json" for slug in example_law_slugs} <= {p.name for p in (tmp_path / "laws").iterdir()}
+
+
+@pytest.mark.parametrize("items", [[], [{"a": [1, {"b": "x\ny"}]}], [{}, [], "z"]])
+def test_json_data_writer_matches_json_dumps(items):
+    f = io.StringIO()
+    with gesetze_im_internet._json_data_writer(f) as write_item:
+        for item in items:
+            write_item(item)
+
+    assert f.getvalue() == json.dumps({"data": items}, indent=2) + "\n"
+
+
+def _read_json_files(dir_path):
+    with gzip.open(dir_path / "all_laws.json.gz", "rt", encoding="utf-8") as f:
+        all_laws = f.read()
+    return all_laws, {p.name: p.read_text() for p in (dir_path / "laws").iterdir()}
+
+
+def test_write_all_law_json_files_in_workers_matches_serial_output(tmp_path):
+    with db.session_scope() as session:
+        data_location = location_from_string(xml_fixtures_dir)
+        for slug in example_law_slugs:
+            gesetze_im_internet.ingest_law(session, data_location, slug)
+
+    with db.session_scope() as session:
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path / "serial"))
+    with db.session_scope() as session:
+        gesetze_im_internet.write_all_law_json_files(session, str(tmp_path / "parallel"), workers=2, chunk_size=2)
+
+    assert _read_json_files(tmp_path / "parallel") == _read_json_files(tmp_path / "serial")
+    assert [p.name for p in (tmp_path / "parallel").iterdir() if p.is_file()] == ["all_laws.json.gz"]
@@ -0,0 +1,44 @@
+import os
+
+from rip_api.gesetze_im_internet.download import LocalPathLocation
+from rip_api.gesetze_im_internet.parse_cache import ParseCache
+from rip_api.gesetze_im_internet.parsing import parse_law
+from .utils import xml_fixtures_dir
+
+
+def _parse_fixture(slug):
+    return parse_law(LocalPathLocation(xml_fixtures_dir).xml_file_for(slug))
+
+
+def test_round_trip_restores_parent_references(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    law_dict = _parse_fixture("skaufg")
+
+    cache.put("abc", law_dict)
+    cached = cache.get("abc")
+
+    assert cached == law_dict
+    contents = cached["contents"]
+    assert contents[3]["parent"] is contents[2]
+
+
+def test_get_unknown_key_returns_none(tmp_path):
+    assert ParseCache(str(tmp_path)).get("unknown") is None
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    law_dict = _parse_fixture("jfdg")
+    cache = ParseCache(str(tmp_path))
+    cache.put("first", law_dict)
+    entry_size = os.path.getsize(tmp_path / "first.json.gz")
+
+    cache = ParseCache(str(tmp_path), max_bytes=entry_size * 2)
+    cache.put("second", law_dict)
+    os.utime(tmp_path / "first.json.gz", (0, 0))
+    os.utime(tmp_path / "second.json.gz", (1, 1))
+    cache.get("first")
+    cache.put("third", law_dict)
+
+    assert cache.get("first") is not None
+    assert cache.get("second") is None
+    assert cache.get("third") is not None
@@ -1,6 +1,13 @@
+from io import BytesIO
+import os
 from unittest import mock
 
-from rip_api.gesetze_im_internet.parsing import parse_law
+from lxml import etree
+import pytest
+
+from rip_api.gesetze_im_internet.download import LocalPathLocation
+from rip_api.gesetze_im_internet.parsing import _text, iter_norms_from_file, parse_law
+from .utils import xml_fixtures_dir
 
 
 def test_parser():
@@ -178,6 +185,38 @@ def test_parser():
     assert item["parent"] is None
 
 
+@pytest.mark.parametrize("slug", sorted(os.listdir(xml_fixtures_dir)))
+def test_streaming_parser_matches_in_memory_parser(slug):
+    xml_file = LocalPathLocation(xml_fixtures_dir).xml_file_for(slug)
+
+    assert parse_law(xml_file, streaming=True) == parse_law(xml_file)
+
+
+def test_streaming_parser_discards_processed_norms():
+    preceding_norms = []
+    for norm in iter_norms_from_file(BytesIO(XML_DATA.encode("utf-8"))):
+        preceding_norms.append(list(norm.itersiblings(preceding=True)))
+
+    assert len(preceding_norms) == 10
+    # Only the directly preceding norm is kept around, and its content has been cleared.
+    assert all(len(preceding) <= 1 for preceding in preceding_norms)
+    assert all(len(preceding[0]) == 0 for preceding in preceding_norms[1:])
+
+
+def test_text_preserves_inner_tags():
+    element = etree.fromstring(
+        '<Content> a &amp; b &gt; c<P x="1&gt;2">c &lt; d<BR/></P>tail &amp;<!-- note --><P/> </Content>'
+    )
+
+    # Leading text is unescaped, the serialized children (and their tails) are not.
+    assert _text([element]) == 'a & b > c<P x="1&gt;2">c &lt; d<BR/></P>tail &amp;<!-- note --><P/>'
+
+
+def test_text_without_child_elements():
+    assert _text([etree.fromstring("<enbez> § 1 &amp; 2 </enbez>")]) == "§ 1 & 2"
+    assert _text([etree.fromstring("<Content/>")]) is None
+
+
 XML_DATA = """\
 <?xml version="1.0" encoding="UTF-8" ?><!DOCTYPE dokumente SYSTEM "http://www.gesetze-im-internet.de/dtd/1.01/gii-norm.dtd">
 <dokumente builddate="20200722212521" doknr="BJNR055429995"><norm builddate="20200722212521" doknr="BJNR055429995"><metadaten><jurabk>SkAufG</jurabk><amtabk>SkAufG</amtabk><ausfertigung-datum manuell="ja">1995-07-20</ausfertigung-datum><fundstelle typ="amtlich"><periodikum>BGBl II</periodikum><zitstelle>1995, 554</zitstelle></fundstelle><kurzue>Streitkräfteaufenthaltsgesetz</kurzue><langue>Gesetz über die Rechtsstellung ausländischer Streitkräfte bei
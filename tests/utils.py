@@ -1,5 +1,7 @@
+from io import BytesIO
 import json
 import os
+import zipfile
 
 from rip_api import models
 from rip_api.gesetze_im_internet import download, parsing
@@ -20,3 +22,13 @@ def load_law_from_fixture(slug):
     law = models.Law.from_dict(law_dict, slug)
     law.attachment_names = location.attachment_names(slug)
     return law
+
+
+def zip_law_fixture(slug, compression=zipfile.ZIP_DEFLATED):
+    """Build a zip archive of a law's fixture files, as served by gesetze-im-internet.de."""
+    buf = BytesIO()
+    law_dir = os.path.join(xml_fixtures_dir, slug)
+    with zipfile.ZipFile(buf, "w", compression) as zip_archive:
+        for filename in sorted(os.listdir(law_dir)):
+            zip_archive.write(os.path.join(law_dir, filename), filename)
+    return buf.getvalue()